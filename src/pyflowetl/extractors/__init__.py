@@ -1,9 +1,13 @@
 from .xlsx_extractor import XlsxExtractor
 from .csv_extractor import CsvExtractor
 from .postgres_extractor import PostgresExtractor
+from .parquet_extractor import ParquetExtractor
+from .duckdb_extractor import DuckDbExtractor
 
 __all__ = [
     "XlsxExtractor",
     "CsvExtractor",
-    "PostgresExtractor"
+    "PostgresExtractor",
+    "ParquetExtractor",
+    "DuckDbExtractor",
 ]
\ No newline at end of file
@@ -1,13 +1,26 @@
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
 import pandas as pd
-from clickhouse_driver import Client
+from clickhouse_driver.protocol import ServerPacketTypes
+from pyflowetl.connections import clickhouse_client
 from pyflowetl.log import get_logger, log_memory_usage
+from pyflowetl.utils.watermark_store import WatermarkStore, max_watermark
 
 
 class ClickHouseExtractor:
     def __init__(self, host: str = 'localhost', port: int = 9000,
                  user: str = 'default', password: str = '',
                  database: str = 'default', table_name: str = None,
-                 query: str = None, settings: dict = None):
+                 query: str = None, settings: dict = None,
+                 watermark_column: str = None, state_path: str = ".pyflowetl_state.json",
+                 job_name: str = None, auto_commit_watermark: bool = True,
+                 chunksize: int = None, use_numpy: bool = False,
+                 shard_key: str = None, partition_expression: str = None,
+                 num_partitions: int = 4, max_workers: int = None,
+                 cache=None, cache_watermark=None):
         """
         :param host: Host del server ClickHouse
         :param port: Porta (default 9000 per protocollo nativo)
@@ -17,6 +30,35 @@ class ClickHouseExtractor:
         :param table_name: Nome della tabella (se query è None)
         :param query: Query SQL personalizzata
         :param settings: Dizionario opzionale di impostazioni ClickHouse (es. {'max_block_size': 100000})
+        :param watermark_column: colonna monotona crescente per l'estrazione incrementale
+                                 (vengono lette solo le righe con valore maggiore dell'ultimo salvato)
+        :param state_path: file JSON in cui salvare i watermark (uno per job)
+        :param job_name: chiave del job nello state file
+                         (default: host:porta/database.tabella o host:porta/database.hash della query)
+        :param auto_commit_watermark: se False il watermark va confermato con commit_watermark()
+        :param chunksize: se impostato, lettura in streaming (execute_iter) a blocchi di N righe:
+                          vedi extract_chunks(). La memoria resta limitata al singolo blocco.
+        :param use_numpy: se True si usa un client costruito con use_numpy (pool dedicato):
+                          i blocchi nativi vengono decodificati in array NumPy e il DataFrame
+                          è costruito per colonne, senza oggetti Python per valore
+        :param shard_key: espressione/colonna per la lettura parallela: la query viene divisa
+                          in num_partitions letture `cityHash64(shard_key) % N = i`
+        :param partition_expression: in alternativa a shard_key, condizione personalizzata
+                                     con i segnaposto {i} e {n} (es. "toYYYYMM(data) % {n} = {i}")
+        :param num_partitions: numero di letture parallele (default 4)
+        :param max_workers: connessioni/thread contemporanei (default num_partitions)
+        :param cache: QueryResultCache opzionale; su hit la query non viene eseguita
+        :param cache_watermark: valore aggiunto alla chiave di cache (es. data di riferimento)
+
+        Esempio (lettura parallela)
+        ---------------------------
+        ClickHouseExtractor(
+            host="127.0.0.1",
+            database="analytics",
+            table_name="events",
+            shard_key="user_id",
+            num_partitions=8,
+        )
         """
         self.config = {
             'host': host,
@@ -28,21 +70,63 @@ class ClickHouseExtractor:
         }
         self.table_name = table_name
         self.query = query
+        self.watermark_column = watermark_column
+        self.job_name = job_name or self._default_job_name()
+        self.auto_commit_watermark = auto_commit_watermark
+        self.state_store = WatermarkStore(state_path) if watermark_column else None
+        self._pending_watermark = None
+        self.chunksize = chunksize
+        self.use_numpy = use_numpy
+        if shard_key and partition_expression:
+            raise ValueError("[ClickHouseExtractor] Usa shard_key oppure partition_expression, non entrambi")
+        self.partition_expression = partition_expression or (
+            f"cityHash64({shard_key}) % {{n}} = {{i}}" if shard_key else None
+        )
+        self.num_partitions = max(1, int(num_partitions))
+        self.max_workers = max_workers or self.num_partitions
+        self.cache = cache
+        self.cache_watermark = cache_watermark
         self.logger = get_logger()
 
     def extract(self) -> pd.DataFrame:
         self.logger.info("[ClickHouseExtractor] Avvio estrazione")
 
-        sql = self.query or f"SELECT * FROM {self.table_name}"
+        sql = self._build_sql()
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(sql, self._connection_id(), self.cache_watermark)
+            df = self.cache.get(cache_key)
+            if df is not None:
+                self.logger.info(f"[ClickHouseExtractor] Risultato da cache: {len(df)} righe")
+                self._track_watermark(df)
+                if self.auto_commit_watermark:
+                    self.commit_watermark()
+                return df
+
         self.logger.info(f"[ClickHouseExtractor] Eseguo query: {sql}")
 
         try:
-            # Utilizzo del protocollo nativo tramite clickhouse-driver
-            client = Client(**self.config)
+            # Utilizzo del protocollo nativo tramite clickhouse-driver,
+            # con client preso dal pool condiviso (pyflowetl.connections)
+            if self.partition_expression:
+                df = self._extract_partitioned(sql)
+            elif self.chunksize:
+                frames = list(self._iter_chunks(sql))
+                df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            else:
+                with clickhouse_client(**self._client_config()) as client:
+                    # query_dataframe restituisce direttamente un oggetto DataFrame
+                    # Nota: richiede che 'pandas' sia installato nell'ambiente.
+                    # Con use_numpy (client NumPy) le colonne arrivano già come array NumPy.
+                    df = client.query_dataframe(sql, settings=self._query_settings())
 
-            # query_dataframe restituisce direttamente un oggetto DataFrame
-            # Nota: richiede che 'pandas' sia installato nell'ambiente
-            df = client.query_dataframe(sql)
+            if cache_key is not None:
+                self._cache_put(cache_key, df)
+
+            self._track_watermark(df)
+            if self.auto_commit_watermark:
+                self.commit_watermark()
 
             self.logger.info(f"[ClickHouseExtractor] Estratte {len(df)} righe")
             log_memory_usage("[ClickHouseExtractor] post-extract")
@@ -52,7 +136,162 @@ class ClickHouseExtractor:
         except Exception as e:
             self.logger.error(f"[ClickHouseExtractor] Errore durante l'estrazione: {e}")
             raise
-        finally:
-            # Il driver gestisce internamente il pool, ma è bene assicurarsi
-            # che le risorse temporanee siano liberate se necessario.
-            pass
\ No newline at end of file
+
+    def extract_chunks(self):
+        """
+        Generatore di DataFrame da `chunksize` righe (default 100_000), letti in streaming.
+        """
+        for chunk in self._iter_chunks(self._build_sql()):
+            self._track_watermark(chunk)
+            yield chunk
+
+        if self.auto_commit_watermark:
+            self.commit_watermark()
+
+    def commit_watermark(self):
+        """
+        Salva nello state file il watermark più alto visto nell'ultima estrazione.
+        """
+        if self.state_store is None or self._pending_watermark is None:
+            return
+        self.state_store.set(self.job_name, self._pending_watermark)
+        self._pending_watermark = None
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _client_config(self) -> dict:
+        """
+        Config del client. Con use_numpy il setting va dato alla costruzione del Client:
+        solo così clickhouse-driver usa i blocchi/risultati NumPy (come setting per query
+        i blocchi verrebbero comunque convertiti in righe o liste Python).
+        Il pool condiviso è per configurazione, quindi i client NumPy hanno un pool proprio.
+        """
+        if not self.use_numpy:
+            return self.config
+        settings = dict(self.config["settings"])
+        settings["use_numpy"] = True
+        return {**self.config, "settings": settings}
+
+    def _query_settings(self, block_size: int = None) -> dict:
+        settings = {}
+        if block_size:
+            settings["max_block_size"] = block_size
+        return settings
+
+    @staticmethod
+    def _column_names(columns_with_types) -> list:
+        # Stessa normalizzazione di Client.query_dataframe (es. 'count()' -> 'count__')
+        return [re.sub(r"\W", "_", name) for name, _ in columns_with_types]
+
+    def _iter_chunks(self, sql: str):
+        """
+        Un DataFrame per blocco nativo (max_block_size = chunksize), costruito dalle
+        colonne del blocco: nessuna conversione in righe/tuple.
+        clickhouse-driver non espone un iteratore pubblico per blocchi: si usa lo stesso
+        flusso di execute_iter (send_query + packet_generator) fermandosi ai blocchi.
+        """
+        chunksize = max(2, self.chunksize or 100_000)
+        settings = self._query_settings(block_size=chunksize)
+        with clickhouse_client(**self._client_config()) as client:
+            columns = None
+            n_chunk = 0
+            try:
+                with client.disconnect_on_error(sql, settings):
+                    client.connection.send_query(sql)
+                    client.connection.send_external_tables(None)
+
+                    for packet in client.packet_generator():
+                        # Solo i blocchi dati (niente TOTALS/EXTREMES)
+                        if packet.type != ServerPacketTypes.DATA or packet.block is None:
+                            continue
+                        block = packet.block
+                        if columns is None and block.columns_with_types:
+                            columns = self._column_names(block.columns_with_types)
+                        if not block.num_rows:
+                            continue
+                        n_chunk += 1
+                        self.logger.info(f"[ClickHouseExtractor] Chunk {n_chunk}: {block.num_rows} righe")
+                        yield pd.DataFrame(dict(zip(columns, block.get_columns())), columns=columns)
+            except GeneratorExit:
+                # Stream interrotto a metà: il client ha ancora pacchetti pendenti,
+                # va disconnesso prima di tornare nel pool
+                client.disconnect()
+                raise
+
+            if n_chunk == 0 and columns is not None:
+                yield pd.DataFrame(columns=columns)
+
+    def _extract_partitioned(self, sql: str) -> pd.DataFrame:
+        n = self.num_partitions
+        queries = [
+            f"SELECT * FROM ({sql}) AS _part WHERE {self.partition_expression.format(i=i, n=n)}"
+            for i in range(n)
+        ]
+        self.logger.info(f"[ClickHouseExtractor] Lettura parallela in {n} partizioni con {self.max_workers} connessioni")
+
+        def read_partition(item):
+            i, part_sql = item
+            with clickhouse_client(max_size=self.max_workers, **self._client_config()) as client:
+                df_part = client.query_dataframe(part_sql, settings=self._query_settings())
+            self.logger.info(f"[ClickHouseExtractor] Partizione {i + 1}/{n}: {len(df_part)} righe")
+            return df_part
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            frames = list(pool.map(read_partition, enumerate(queries)))
+
+        return pd.concat(frames, ignore_index=True)
+
+    def _build_sql(self) -> str:
+        sql = self.query or f"SELECT * FROM {self.table_name}"
+        if not self.watermark_column:
+            return sql
+
+        last = self.state_store.get(self.job_name)
+        if last is None:
+            self.logger.info(f"[ClickHouseExtractor] Nessun watermark per '{self.job_name}': estrazione completa")
+            return sql
+
+        self.logger.info(f"[ClickHouseExtractor] Estrazione incrementale: {self.watermark_column} > {last}")
+        return f"SELECT * FROM ({sql}) AS _inc WHERE {self.watermark_column} > {self._sql_literal(last)}"
+
+    def _cache_put(self, key: str, df: pd.DataFrame):
+        # La cache è un'ottimizzazione: un errore di scrittura non deve far fallire l'estrazione
+        try:
+            self.cache.put(key, df)
+        except Exception as e:
+            self.logger.warning(f"[ClickHouseExtractor] Risultato non salvato in cache: {e}")
+
+    def _connection_id(self) -> str:
+        c = self.config
+        return f"clickhouse://{c['user']}@{c['host']}:{c['port']}/{c['database']}"
+
+    def _default_job_name(self) -> str:
+        # Prefisso host:porta/database: stessa tabella su server diversi = job diversi nello state file
+        c = self.config
+        prefix = f"{c['host']}:{c['port']}/{c['database']}"
+        if self.table_name:
+            return f"{prefix}.{self.table_name}"
+        if self.query:
+            return f"{prefix}.query_" + hashlib.sha1(self.query.encode("utf-8")).hexdigest()[:12]
+        return prefix
+
+    def _track_watermark(self, df: pd.DataFrame):
+        if not self.watermark_column:
+            return
+        value = max_watermark(df, self.watermark_column)
+        if value is not None and (self._pending_watermark is None or value > self._pending_watermark):
+            self._pending_watermark = value
+
+    @staticmethod
+    def _sql_literal(value) -> str:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return repr(value)
+        if isinstance(value, datetime):
+            # BestEffort accetta anche l'offset del fuso: il confronto resta corretto
+            return f"parseDateTime64BestEffort('{value.isoformat()}', 6)"
+        if isinstance(value, date):
+            return f"toDate('{value.isoformat()}')"
+        s = str(value).replace("\\", "\\\\").replace("'", "\\'")
+        return f"'{s}'"
@@ -1,60 +1,80 @@
 import pandas as pd
 import os
-import chardet
+import bz2
+import gzip
+import lzma
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pyflowetl.log import get_logger, log_memory_usage
+from pyflowetl.utils.encoding_detector import EncodingDetector
+
+_COMPRESSION_BY_EXT = {
+    ".gz": "gzip",
+    ".gzip": "gzip",
+    ".zip": "zip",
+    ".zst": "zstd",
+    ".zstd": "zstd",
+    ".bz2": "bz2",
+    ".xz": "xz",
+}
+
 
 class CsvExtractor:
-    def __init__(self, filepath, encoding=None, delimiter=",", low_memory=True):
+    """
+    Estrattore CSV con supporto a file compressi (.gz, .zip, .zst, .bz2, .xz).
+
+    La decompressione avviene in streaming dentro il parser: il file decompresso
+    non viene mai scritto su disco né tenuto interamente in memoria come testo.
+    Gli archivi ZIP con più membri CSV vengono letti in parallelo e concatenati
+    nell'ordine dell'archivio.
+
+    :param filepath: percorso del file
+    :param encoding: encoding del file (None = rilevamento automatico)
+    :param delimiter: separatore di campo
+    :param low_memory: passato a pandas.read_csv
+    :param chunksize: se impostato, il file viene letto a blocchi di N righe (vedi extract_chunks)
+    :param compression: 'infer' (da estensione) | None | 'gzip' | 'zip' | 'zstd' | 'bz2' | 'xz'
+    :param max_workers: thread per la lettura parallela dei membri ZIP (default: numero membri, max 8)
+    """
+
+    def __init__(self, filepath, encoding=None, delimiter=",", low_memory=True,
+                 chunksize=None, compression="infer", max_workers=None):
         self.filepath = filepath
         self.encoding = encoding  # ← può essere None, verrà rilevato
         self.delimiter = delimiter
         self.low_memory = low_memory
+        self.chunksize = chunksize
+        self.compression = compression
+        self.max_workers = max_workers
 
-    def detect_encoding(self, num_bytes: int = 100_000):
-        with open(self.filepath, "rb") as f:
-            raw = f.read(num_bytes)
-        result = chardet.detect(raw)
-        return result["encoding"], result["confidence"]
+    def detect_encoding(self, num_bytes: int = 64_000, member: str = None):
+        """
+        Campiona testa, centro e coda del file (mmap); il risultato è in cache per path+size+mtime.
+        Per i file compressi viene campionata solo la testa dello stream decompresso.
+        """
+        detector = EncodingDetector(sample_size=num_bytes)
+        if self._compression() is None:
+            return detector.detect(self.filepath)
+
+        key = EncodingDetector.fingerprint(self.filepath) + (member,)
+        with self._open_stream(member) as stream:
+            return detector.detect_stream(stream, key=key)
 
     def extract(self):
         logger = get_logger()
         logger.info(f"[CsvExtractor] Leggo file: {self.filepath}")
-
-        if not os.path.exists(self.filepath):
-            logger.error(f"[CsvExtractor] File non trovato: {self.filepath}")
-            raise FileNotFoundError(f"File non trovato: {self.filepath}")
+        self._check_exists()
 
         try:
-            # autodetect
-            detected_encoding, confidence = self.detect_encoding()
-            logger.info(f"[CsvExtractor] Encoding rilevato: {detected_encoding} (confidence={confidence:.2f})")
-
-            encoding_to_use = self.encoding or detected_encoding or "utf-8"
+            members = self._zip_members() if self._compression() == "zip" else [None]
 
-            try:
-                df = pd.read_csv(
-                    self.filepath,
-                    encoding=encoding_to_use,
-                    delimiter=self.delimiter,
-                    keep_default_na=False,
-                    na_values=[],
-                    dtype=str,
-                low_memory=self.low_memory,
-                )
-            except UnicodeDecodeError:
-                logger.warning(f"[CsvExtractor] Errore con encoding '{encoding_to_use}', provo fallback 'cp1252'")
-                df = pd.read_csv(
-                    self.filepath,
-                    encoding="cp1252",
-                    delimiter=self.delimiter,
-                    keep_default_na=False,
-                    low_memory=self.low_memory,
-                )
-
-            # Rimozione BOM dalla prima colonna, se presente
-
-            # Rimuove BOM e virgolette dai nomi delle colonne
-            df.columns = [col.strip().replace('\ufeff', '').replace('ï»¿', '').replace('"', '') for col in df.columns]
+            if len(members) > 1:
+                df = self._extract_members_parallel(members)
+            elif self.chunksize:
+                frames = list(self.extract_chunks())
+                df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            else:
+                df = self._read_member(members[0])
 
             logger.info(f"[CsvExtractor] Letti {len(df)} record")
             log_memory_usage(f"[CsvExtractor] Dopo lettura file: {self.filepath}")
@@ -63,3 +83,149 @@ class CsvExtractor:
         except Exception as e:
             logger.exception(f"[CsvExtractor] Errore durante la lettura del file: {e}")
             raise
+
+    def extract_chunks(self):
+        """
+        Generatore di DataFrame da `chunksize` righe (default 100_000 se non impostato).
+        Con file compressi la decompressione procede di pari passo con il parsing.
+        """
+        logger = get_logger()
+        self._check_exists()
+        chunksize = self.chunksize or 100_000
+        members = self._zip_members() if self._compression() == "zip" else [None]
+
+        for member in members:
+            for i, chunk in enumerate(self._iter_member_chunks(member, chunksize)):
+                chunk.columns = self._clean_columns(chunk.columns)
+                logger.info(f"[CsvExtractor] Chunk {i + 1} ({member or self.filepath}): {len(chunk)} record")
+                yield chunk
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _check_exists(self):
+        if not os.path.exists(self.filepath):
+            get_logger().error(f"[CsvExtractor] File non trovato: {self.filepath}")
+            raise FileNotFoundError(f"File non trovato: {self.filepath}")
+
+    def _compression(self):
+        if self.compression != "infer":
+            return self.compression
+        name = self.filepath.lower()
+        for ext, kind in _COMPRESSION_BY_EXT.items():
+            if name.endswith(ext):
+                return kind
+        return None
+
+    def _zip_members(self):
+        with zipfile.ZipFile(self.filepath) as zf:
+            members = [i.filename for i in zf.infolist() if not i.is_dir() and not i.filename.startswith("__MACOSX/")]
+        if not members:
+            raise ValueError(f"[CsvExtractor] Archivio ZIP vuoto: {self.filepath}")
+        return members
+
+    def _open_stream(self, member=None):
+        """
+        Apre il file come stream binario, decomprimendo al volo se necessario.
+        """
+        kind = self._compression()
+        if kind is None:
+            return open(self.filepath, "rb")
+        if kind == "gzip":
+            return gzip.open(self.filepath, "rb")
+        if kind == "bz2":
+            return bz2.open(self.filepath, "rb")
+        if kind == "xz":
+            return lzma.open(self.filepath, "rb")
+        if kind == "zip":
+            # ZipFile separato per ogni stream: sicuro anche con letture da più thread.
+            # Il file resta aperto finché lo stream del membro non viene chiuso.
+            with zipfile.ZipFile(self.filepath) as zf:
+                return zf.open(member or self._zip_members()[0], "r")
+        if kind == "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                raise ImportError("[CsvExtractor] Per i file .zst installa il pacchetto 'zstandard'") from e
+            raw = open(self.filepath, "rb")
+            return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        raise ValueError(f"[CsvExtractor] Compressione non supportata: {kind}")
+
+    def _resolve_encoding(self, member=None):
+        logger = get_logger()
+        # autodetect solo se l'encoding non è stato passato
+        if self.encoding:
+            logger.info(f"[CsvExtractor] Encoding impostato: {self.encoding}")
+            return self.encoding
+
+        detected_encoding, confidence = self.detect_encoding(member=member)
+        logger.info(f"[CsvExtractor] Encoding rilevato: {detected_encoding} (confidence={confidence:.2f})")
+        return detected_encoding or "utf-8"
+
+    def _read_kwargs(self, encoding):
+        return dict(
+            encoding=encoding,
+            delimiter=self.delimiter,
+            keep_default_na=False,
+            na_values=[],
+            dtype=str,
+            low_memory=self.low_memory,
+        )
+
+    def _iter_member_chunks(self, member, chunksize):
+        """
+        Lettura a blocchi con lo stesso fallback 'cp1252' di _read_member.
+        Se l'errore arriva a metà file, la rilettura in cp1252 salta i blocchi già
+        restituiti (i confini dei blocchi dipendono solo dal numero di righe).
+        """
+        encoding_to_use = self._resolve_encoding(member)
+        yielded = 0
+        try:
+            with self._open_stream(member) as stream:
+                for chunk in pd.read_csv(stream, chunksize=chunksize, **self._read_kwargs(encoding_to_use)):
+                    yielded += 1
+                    yield chunk
+        except UnicodeDecodeError:
+            get_logger().warning(
+                f"[CsvExtractor] Errore con encoding '{encoding_to_use}' al chunk {yielded + 1}, "
+                f"provo fallback 'cp1252'"
+            )
+            with self._open_stream(member) as stream:
+                reader = pd.read_csv(stream, chunksize=chunksize, **self._read_kwargs("cp1252"))
+                for i, chunk in enumerate(reader):
+                    if i >= yielded:
+                        yield chunk
+
+    def _read_member(self, member=None) -> pd.DataFrame:
+        logger = get_logger()
+        encoding_to_use = self._resolve_encoding(member)
+
+        try:
+            with self._open_stream(member) as stream:
+                df = pd.read_csv(stream, **self._read_kwargs(encoding_to_use))
+        except UnicodeDecodeError:
+            logger.warning(f"[CsvExtractor] Errore con encoding '{encoding_to_use}', provo fallback 'cp1252'")
+            with self._open_stream(member) as stream:
+                df = pd.read_csv(stream, **self._read_kwargs("cp1252"))
+
+        # Rimuove BOM e virgolette dai nomi delle colonne
+        df.columns = self._clean_columns(df.columns)
+        return df
+
+    def _extract_members_parallel(self, members) -> pd.DataFrame:
+        logger = get_logger()
+        workers = self.max_workers or min(len(members), 8)
+        logger.info(f"[CsvExtractor] Archivio ZIP con {len(members)} membri, lettura parallela ({workers} thread)")
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(self._read_member, members))
+
+        for member, frame in zip(members, frames):
+            logger.info(f"[CsvExtractor] Membro {member}: {len(frame)} record")
+        return pd.concat(frames, ignore_index=True)
+
+    @staticmethod
+    def _clean_columns(columns):
+        return [col.strip().replace('\ufeff', '').replace('ï»¿', '').replace('"', '') for col in columns]
+
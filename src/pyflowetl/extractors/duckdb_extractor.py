@@ -0,0 +1,125 @@
+import importlib.util
+import duckdb
+import pandas as pd
+from pyflowetl.log import get_logger, log_memory_usage
+
+
+class DuckDbExtractor:
+    """
+    Estrattore DuckDB: legge da un file DuckDB, da un glob Parquet o da un CSV.
+
+    Il risultato passa per Arrow (fetch_arrow_table) e da lì a pandas senza
+    serializzazioni intermedie; con chunksize la lettura è a record batch
+    (fetch_record_batch), con memoria limitata al singolo batch.
+
+    Parametri
+    ---------
+    connection : str o duckdb.DuckDBPyConnection
+        Percorso del DB DuckDB (default ':memory:') oppure connessione già aperta.
+    query : str, opzionale
+        Query SQL da eseguire.
+    table_name : str, opzionale
+        Tabella da leggere (se query è None).
+    parquet : str, opzionale
+        Percorso o glob di file Parquet (es. 'staging/*.parquet'), letto con read_parquet.
+    csv : str, opzionale
+        Percorso di un CSV, letto con read_csv_auto.
+    chunksize : int, opzionale
+        Righe per batch in extract_chunks() (default 100_000).
+    read_only : bool
+        Apre il file DuckDB in sola lettura (permette letture concorrenti). Default True.
+
+    Esempio
+    -------
+    df = DuckDbExtractor("staging.duckdb", query="SELECT * FROM attivi WHERE anno = 2024").extract()
+
+    df = DuckDbExtractor(parquet="export/2024-*.parquet").extract()
+
+    for chunk in DuckDbExtractor(csv="input/big.csv", chunksize=200_000).extract_chunks():
+        ...
+    """
+
+    def __init__(self, connection=":memory:", query: str = None, table_name: str = None,
+                 parquet: str = None, csv: str = None, chunksize: int = None, read_only: bool = True):
+        sources = [s for s in (query, table_name, parquet, csv) if s]
+        if len(sources) != 1:
+            raise ValueError("[DuckDbExtractor] Specificare esattamente uno tra query, table_name, parquet, csv")
+
+        self.connection = connection
+        self.query = query
+        self.table_name = table_name
+        self.parquet = parquet
+        self.csv = csv
+        self.chunksize = chunksize
+        self.read_only = read_only
+        self.logger = get_logger()
+
+    def extract(self) -> pd.DataFrame:
+        sql = self._build_sql()
+        self.logger.info(f"[DuckDbExtractor] Eseguo query: {sql}")
+
+        con, owned = self._connect()
+        try:
+            result = con.execute(sql)
+            if self._has_pyarrow():
+                # Arrow → pandas: conversione colonnare, senza passare per righe Python
+                df = result.fetch_arrow_table().to_pandas(split_blocks=True, self_destruct=True)
+            else:
+                df = result.df()
+
+            self.logger.info(f"[DuckDbExtractor] Estratte {len(df)} righe")
+            log_memory_usage("[DuckDbExtractor] post-extract")
+            return df
+        except Exception as e:
+            self.logger.exception(f"[DuckDbExtractor] Errore durante l'estrazione: {e}")
+            raise
+        finally:
+            if owned:
+                con.close()
+
+    def extract_chunks(self):
+        """
+        Generatore di DataFrame, un record batch Arrow alla volta.
+        """
+        sql = self._build_sql()
+        batch_size = self.chunksize or 100_000
+        self.logger.info(f"[DuckDbExtractor] Lettura a batch ({batch_size} righe): {sql}")
+
+        con, owned = self._connect()
+        try:
+            reader = con.execute(sql).fetch_record_batch(batch_size)
+            for i, batch in enumerate(reader):
+                self.logger.info(f"[DuckDbExtractor] Batch {i + 1}: {batch.num_rows} righe")
+                yield batch.to_pandas()
+        finally:
+            if owned:
+                con.close()
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _build_sql(self) -> str:
+        if self.query:
+            return self.query
+        if self.table_name:
+            return f"SELECT * FROM {self.table_name}"
+        if self.parquet:
+            return f"SELECT * FROM read_parquet({self._quote(self.parquet)})"
+        return f"SELECT * FROM read_csv_auto({self._quote(self.csv)})"
+
+    def _connect(self):
+        # Connessione già aperta: la usiamo ma non la chiudiamo
+        if hasattr(self.connection, "execute"):
+            return self.connection, False
+        if self.connection == ":memory:":
+            return duckdb.connect(self.connection), True
+        return duckdb.connect(self.connection, read_only=self.read_only), True
+
+    @staticmethod
+    def _quote(value: str) -> str:
+        return "'" + value.replace("'", "''") + "'"
+
+    @staticmethod
+    def _has_pyarrow() -> bool:
+        return importlib.util.find_spec("pyarrow") is not None
@@ -0,0 +1,184 @@
+import os
+import pandas as pd
+from pyflowetl.log import get_logger, log_memory_usage
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow è opzionale: serve solo per Parquet
+    pq = None
+
+
+class ParquetExtractor:
+    """
+    Estrattore per file Parquet basato su pyarrow.
+
+    - Proiezione colonne: vengono lette solo le colonne richieste.
+    - Pruning dei row group tramite le statistiche min/max del file: i row group
+      che sicuramente non soddisfano i predicati non vengono nemmeno letti.
+      I predicati sono poi applicati anche riga per riga sui row group letti.
+    - Lettura via memory map quando il file è locale.
+    - Iterazione un row group alla volta con extract_chunks().
+
+    Parametri
+    ---------
+    filepath : str
+        Percorso del file .parquet
+    columns : list[str], opzionale
+        Colonne da leggere (None = tutte)
+    filters : list[tuple], opzionale
+        Predicati in AND nella forma (colonna, operatore, valore).
+        Operatori: '==', '=', '!=', '<', '<=', '>', '>=', 'in', 'not in'.
+    memory_map : bool
+        Usa mmap per la lettura (default True)
+    use_threads : bool
+        Decodifica multi-thread delle colonne (default True)
+
+    Esempio
+    -------
+    extractor = ParquetExtractor(
+        "staging/contratti.parquet",
+        columns=["pod", "data_attivazione", "stato"],
+        filters=[("data_attivazione", ">=", date(2024, 1, 1)), ("stato", "in", ["ATTIVO", "SOSPESO"])],
+    )
+    df = extractor.extract()
+
+    for chunk in extractor.extract_chunks():
+        ...
+    """
+
+    _OPERATORS = ("==", "=", "!=", "<", "<=", ">", ">=", "in", "not in")
+
+    def __init__(self, filepath: str, columns: list = None, filters: list = None,
+                 memory_map: bool = True, use_threads: bool = True):
+        if pq is None:
+            raise ImportError("[ParquetExtractor] Installa 'pyarrow' per leggere file Parquet")
+
+        self.filepath = filepath
+        self.columns = columns
+        self.filters = [self._normalize_filter(f) for f in (filters or [])]
+        self.memory_map = memory_map
+        self.use_threads = use_threads
+        self.logger = get_logger()
+
+    def extract(self) -> pd.DataFrame:
+        self.logger.info(f"[ParquetExtractor] Lettura file: {self.filepath}")
+        pf = self._open()
+
+        try:
+            row_groups = self._select_row_groups(pf)
+            table = pf.read_row_groups(row_groups, columns=self._read_columns(), use_threads=self.use_threads)
+            table = self._apply_filters(table)
+
+            # self_destruct libera i buffer Arrow man mano che le colonne vengono convertite
+            df = table.to_pandas(split_blocks=True, self_destruct=True)
+            del table
+
+            self.logger.info(f"[ParquetExtractor] Letti {len(df)} record")
+            log_memory_usage("[ParquetExtractor] post-extract")
+            return df
+        except Exception as e:
+            self.logger.exception(f"[ParquetExtractor] Errore durante la lettura del file: {e}")
+            raise
+        finally:
+            pf.close()
+
+    def extract_chunks(self):
+        """
+        Generatore di DataFrame, uno per row group selezionato.
+        """
+        pf = self._open()
+        try:
+            for i in self._select_row_groups(pf):
+                table = self._apply_filters(
+                    pf.read_row_group(i, columns=self._read_columns(), use_threads=self.use_threads)
+                )
+                self.logger.info(f"[ParquetExtractor] Row group {i}: {table.num_rows} record")
+                yield table.to_pandas(split_blocks=True, self_destruct=True)
+        finally:
+            pf.close()
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _open(self):
+        if not os.path.exists(self.filepath):
+            msg = f"[ParquetExtractor] File non trovato: {self.filepath}"
+            self.logger.error(msg)
+            raise FileNotFoundError(msg)
+        return pq.ParquetFile(self.filepath, memory_map=self.memory_map)
+
+    def _normalize_filter(self, f):
+        col, op, value = f
+        op = op.lower()
+        if op not in self._OPERATORS:
+            raise ValueError(f"[ParquetExtractor] Operatore non supportato: {op}")
+        return col, "==" if op == "=" else op, value
+
+    def _select_row_groups(self, pf) -> list:
+        meta = pf.metadata
+        total = meta.num_row_groups
+        if not self.filters:
+            return list(range(total))
+
+        col_index = {meta.schema.column(j).path: j for j in range(meta.num_columns)}
+        selected = []
+        for i in range(total):
+            rg = meta.row_group(i)
+            if all(self._may_match(rg, col_index, f) for f in self.filters):
+                selected.append(i)
+
+        self.logger.info(f"[ParquetExtractor] Row group selezionati: {len(selected)}/{total}")
+        return selected
+
+    @staticmethod
+    def _may_match(rg, col_index, f) -> bool:
+        """
+        False solo se le statistiche min/max escludono con certezza il row group.
+        """
+        col, op, value = f
+        j = col_index.get(col)
+        if j is None:
+            return True
+        stats = rg.column(j).statistics
+        if stats is None or not stats.has_min_max:
+            return True
+
+        lo, hi = stats.min, stats.max
+        try:
+            if op == "==":
+                return lo <= value <= hi
+            if op == "!=":
+                return not (lo == hi == value)
+            if op == "<":
+                return lo < value
+            if op == "<=":
+                return lo <= value
+            if op == ">":
+                return hi > value
+            if op == ">=":
+                return hi >= value
+            if op == "in":
+                return any(lo <= v <= hi for v in value)
+            if op == "not in":
+                return not (lo == hi and lo in value)
+        except TypeError:
+            # Tipi non confrontabili (es. date vs stringhe): meglio leggere il row group
+            return True
+        return True
+
+    def _read_columns(self):
+        """
+        Colonne da leggere: quelle richieste più quelle usate nei filtri.
+        """
+        if self.columns is None:
+            return None
+        extra = [f[0] for f in self.filters if f[0] not in self.columns]
+        return list(self.columns) + list(dict.fromkeys(extra))
+
+    def _apply_filters(self, table):
+        if self.filters and table.num_rows > 0:
+            table = table.filter(pq.filters_to_expression(self.filters))
+        if self.columns is not None and table.num_columns != len(self.columns):
+            table = table.select(self.columns)
+        return table
@@ -1,27 +1,157 @@
 import os
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 from pyflowetl.log import get_logger, log_memory_usage
 
 class XlsxExtractor:
-    def __init__(self, filepath: str, sheet_name=0):
+    """
+    Estrattore per file Excel.
+
+    :param filepath: percorso del file .xlsx
+    :param sheet_name: nome/indice del foglio, oppure lista di fogli
+                       (in quel caso extract() restituisce {foglio: DataFrame}, letti in parallelo)
+    :param engine: 'openpyxl' | 'calamine' | None (None = calamine se installato, altrimenti openpyxl)
+    :param read_only: se True legge in streaming a righe, senza costruire il modello del workbook
+    :param chunksize: righe per blocco in modalità streaming (implica read_only)
+    :param max_workers: processi per la lettura parallela di più fogli
+    """
+
+    def __init__(self, filepath: str, sheet_name=0, engine: str = None, read_only: bool = False,
+                 chunksize: int = None, max_workers: int = None):
         self.filepath = filepath
         self.sheet_name = sheet_name
+        self.engine = engine
+        self.read_only = read_only or chunksize is not None
+        self.chunksize = chunksize or 50_000
+        self.max_workers = max_workers
         self.logger = get_logger()
 
 
-    def extract(self) -> pd.DataFrame:
+    def extract(self):
         self.logger.info(f"[XlsxExtractor] Lettura file: {self.filepath} (foglio: {self.sheet_name})")
-
-        if not os.path.exists(self.filepath):
-            msg = f"[XlsxExtractor] File non trovato: {self.filepath}"
-            self.logger.error(msg)
-            raise FileNotFoundError(msg)
+        self._check_exists()
 
         try:
-            df = pd.read_excel(self.filepath, sheet_name=self.sheet_name, engine="openpyxl" , dtype=str, keep_default_na=False, na_values=[])
+            if isinstance(self.sheet_name, (list, tuple)):
+                return self._extract_sheets_parallel(list(self.sheet_name))
+
+            df = self._extract_sheet(self.sheet_name)
             self.logger.info(f"[XlsxExtractor] Letti {len(df)} record")
             log_memory_usage("[XlsxExtractor] post-extract")
             return df
         except Exception as e:
             self.logger.exception(f"[XlsxExtractor] Errore durante la lettura del file: {e}")
             raise
+
+    def extract_chunks(self):
+        """
+        Generatore di DataFrame da `chunksize` righe del foglio `sheet_name` (lettura in streaming).
+        """
+        self._check_exists()
+        if isinstance(self.sheet_name, (list, tuple)):
+            raise ValueError("[XlsxExtractor] extract_chunks supporta un solo foglio alla volta")
+        yield from self._iter_sheet_chunks(self.sheet_name)
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _check_exists(self):
+        if not os.path.exists(self.filepath):
+            msg = f"[XlsxExtractor] File non trovato: {self.filepath}"
+            self.logger.error(msg)
+            raise FileNotFoundError(msg)
+
+    def _engine(self) -> str:
+        if self.engine:
+            return self.engine
+        return "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+
+    def _extract_sheet(self, sheet) -> pd.DataFrame:
+        if self.read_only:
+            frames = list(self._iter_sheet_chunks(sheet))
+            return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+        return pd.read_excel(self.filepath, sheet_name=sheet, engine=self._engine(), dtype=str, keep_default_na=False, na_values=[])
+
+    def _iter_sheet_chunks(self, sheet):
+        engine = self._engine()
+        self.logger.info(f"[XlsxExtractor] Lettura streaming foglio {sheet} (engine={engine}, chunksize={self.chunksize})")
+
+        rows = self._iter_rows_calamine(sheet) if engine == "calamine" else self._iter_rows_openpyxl(sheet)
+        header = None
+        buffer = []
+        n_chunk = 0
+        for row in rows:
+            if header is None:
+                header = [self._to_str(v) for v in row]
+                continue
+            buffer.append(row)
+            if len(buffer) >= self.chunksize:
+                n_chunk += 1
+                yield self._rows_to_df(buffer, header)
+                self.logger.info(f"[XlsxExtractor] Chunk {n_chunk}: {len(buffer)} record")
+                buffer = []
+
+        if buffer or (header is not None and n_chunk == 0):
+            yield self._rows_to_df(buffer, header)
+
+    def _iter_rows_openpyxl(self, sheet):
+        from openpyxl import load_workbook
+
+        wb = load_workbook(self.filepath, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[sheet] if isinstance(sheet, int) else wb[sheet]
+            yield from ws.iter_rows(values_only=True)
+        finally:
+            wb.close()
+
+    def _iter_rows_calamine(self, sheet):
+        from python_calamine import CalamineWorkbook
+
+        wb = CalamineWorkbook.from_path(self.filepath)
+        ws = wb.get_sheet_by_index(sheet) if isinstance(sheet, int) else wb.get_sheet_by_name(sheet)
+        yield from ws.iter_rows()
+
+    def _rows_to_df(self, rows, header) -> pd.DataFrame:
+        width = len(header)
+        data = [[self._to_str(v) for v in (list(r[:width]) + [None] * (width - len(r)))] for r in rows]
+        return pd.DataFrame(data, columns=header)
+
+    @staticmethod
+    def _to_str(value) -> str:
+        # Stesse convenzioni di read_excel(dtype=str, keep_default_na=False)
+        if value is None:
+            return ""
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+
+    def _extract_sheets_parallel(self, sheets) -> dict:
+        workers = self.max_workers or min(len(sheets), os.cpu_count() or 1)
+        self.logger.info(f"[XlsxExtractor] Lettura parallela di {len(sheets)} fogli ({workers} processi)")
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(
+                _read_sheet,
+                [self.filepath] * len(sheets),
+                sheets,
+                [self.engine] * len(sheets),
+                [self.read_only] * len(sheets),
+                [self.chunksize] * len(sheets),
+            ))
+
+        result = {}
+        for sheet, df in zip(sheets, frames):
+            self.logger.info(f"[XlsxExtractor] Foglio {sheet}: {len(df)} record")
+            result[sheet] = df
+        log_memory_usage("[XlsxExtractor] post-extract")
+        return result
+
+
+def _read_sheet(filepath, sheet, engine, read_only, chunksize) -> pd.DataFrame:
+    # Funzione di modulo: deve essere picklabile per ProcessPoolExecutor
+    extractor = XlsxExtractor(filepath, sheet_name=sheet, engine=engine, read_only=read_only,
+                              chunksize=chunksize if read_only else None)
+    return extractor._extract_sheet(sheet)
@@ -1,9 +1,11 @@
 import math
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Tuple, Optional
 
 import pandas as pd
-from clickhouse_driver import Client
 
+from pyflowetl.connections import clickhouse_client
 from pyflowetl.log import get_logger, log_memory_usage
 
 
@@ -35,11 +37,62 @@ class ClickHouseLoader:
         Batch size per insert (default 10_000)
 
     upsert_strategy : str
-        'replacing_merge_tree' (default) | 'delete_insert'
+        'replacing_merge_tree' (default) | 'delete_insert' | 'lightweight_delete' | 'replace_partition'
+        - 'lightweight_delete': come delete_insert ma con DELETE FROM ... WHERE
+          (delete leggera, ClickHouse >= 23.3) invece della mutation ALTER TABLE ... DELETE
+        - 'replace_partition': i dati nuovi vanno in una tabella di staging
+          (struttura della target, engine MergeTree semplice con stessi PARTITION BY,
+          ORDER BY e PRIMARY KEY: funziona anche con target Replicated*MergeTree),
+          insieme alle righe esistenti delle partizioni toccate con chiavi non presenti
+          nei dati nuovi; poi ogni partizione è sostituita con
+          ALTER TABLE ... REPLACE PARTITION ID ... FROM staging.
+          Costo: una riscrittura per partizione toccata. La sostituzione è atomica
+          per singola partizione (non tra partizioni diverse).
+          ⚠️ Le scritture concorrenti sulle partizioni toccate, fatte durante il load
+          (tra la copia delle righe esistenti e il REPLACE PARTITION), vanno perse.
+
+    update_strategy : str
+        'row' (default): una mutation ALTER TABLE ... UPDATE per riga.
+        'batch': una sola mutation per blocco di `mutation_chunksize` righe:
+          ALTER TABLE t UPDATE c = multiIf(chiave = k1, v1, chiave = k2, v2, ..., c)
+          WHERE chiave IN (k1, k2, ...)
+        Il numero di mutation cresce con i blocchi, non con le righe.
+        Le chiavi duplicate sono deduplicate prima (vince l'ultima occorrenza).
+
+    mutation_chunksize : int
+        Righe per mutation con update_strategy='batch' (default 1_000)
 
     optimize_final_after_upsert : bool
         Se True fa OPTIMIZE FINAL dopo upsert (⚠️ costoso)
 
+    columnar : bool
+        Se True l'insert invia i dati per colonne (execute(..., columnar=True)):
+        una lista per colonna invece di una tupla per riga, e i NULL sono
+        mappati solo sulle colonne che ne contengono (default False)
+
+    use_numpy : bool
+        Se True l'insert usa client.insert_dataframe con use_numpy: le colonne
+        passano come array NumPy, senza oggetti Python per valore (default False)
+
+    parallelism : int
+        Numero di client (dal pool condiviso) che inseriscono i chunk in parallelo
+        da un thread pool (default 1 = insert sequenziale)
+
+    async_insert : bool
+        Se True gli INSERT usano il setting server `async_insert`: il server accorpa
+        gli insert piccoli in un buffer e crea meno part (default False)
+
+    wait_for_async_insert : bool
+        Con async_insert, se True (default) l'INSERT ritorna solo dopo la scrittura
+        del buffer su disco; con False ritorna subito (nessuna garanzia di
+        visibilità immediata: da evitare con upsert 'delete_insert')
+
+    insert_block_size : int
+        Righe per blocco di insert: usato come dimensione dei chunk di insert e
+        passato come `insert_block_size` al client, così ogni chunk diventa un solo
+        blocco (e una sola part). Conviene allinearlo a `max_insert_block_size`
+        del server (default: chunksize)
+
     Esempio
     -------
     config = {
@@ -81,6 +134,14 @@ class ClickHouseLoader:
         chunksize: int = 10_000,
         upsert_strategy: str = "replacing_merge_tree",
         optimize_final_after_upsert: bool = False,
+        update_strategy: str = "row",
+        mutation_chunksize: int = 1_000,
+        columnar: bool = False,
+        use_numpy: bool = False,
+        parallelism: int = 1,
+        async_insert: bool = False,
+        wait_for_async_insert: bool = True,
+        insert_block_size: Optional[int] = None,
     ):
         if not table_name:
             raise ValueError("[ClickHouseLoader] 'table_name' è obbligatorio.")
@@ -94,30 +155,46 @@ class ClickHouseLoader:
         self.chunksize = int(chunksize)
         self.upsert_strategy = (upsert_strategy or "replacing_merge_tree").lower()
         self.optimize_final_after_upsert = bool(optimize_final_after_upsert)
+        self.update_strategy = (update_strategy or "row").lower()
+        self.mutation_chunksize = int(mutation_chunksize)
+        self.columnar = bool(columnar)
+        self.use_numpy = bool(use_numpy)
+        self.parallelism = max(1, int(parallelism))
+        self.async_insert = bool(async_insert)
+        self.wait_for_async_insert = bool(wait_for_async_insert)
+        self.insert_block_size = int(insert_block_size) if insert_block_size else None
 
         self.logger = get_logger()
 
-        # Client
-        self.client = Client(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            database=database,
-            settings=settings or {},
-        )
+        # Client: preso in prestito dal pool condiviso (pyflowetl.connections) durante load()
+        self.client_config = {
+            "host": host,
+            "port": port,
+            "user": user,
+            "password": password,
+            "database": database,
+            "settings": settings or {},
+        }
+        self.client = None
 
         if self.mode in ("update", "upsert") and not self.unique_keys:
             raise ValueError("[ClickHouseLoader] 'unique_keys' richieste per update/upsert.")
 
-        if self.mode == "upsert" and self.upsert_strategy not in ("replacing_merge_tree", "delete_insert"):
+        if self.mode == "upsert" and self.upsert_strategy not in (
+            "replacing_merge_tree", "delete_insert", "lightweight_delete", "replace_partition"
+        ):
             raise ValueError(f"[ClickHouseLoader] upsert_strategy non supportata: {self.upsert_strategy}")
 
+        if self.mode == "update" and self.update_strategy not in ("row", "batch"):
+            raise ValueError(f"[ClickHouseLoader] update_strategy non supportata: {self.update_strategy}")
+
     # ------------------------------------------------------------------
 
     def load(self, df: pd.DataFrame):
         df_db = self._apply_mapping(df)
-        df_db = self._normalize_df(df_db)
+        if not (self.columnar or self.use_numpy):
+            # Nel percorso colonnare i NULL sono gestiti per colonna al momento dell'insert
+            df_db = self._normalize_df(df_db)
 
         self.logger.info(
             f"[ClickHouseLoader] mode={self.mode} table={self.table_name} rows={len(df_db)} chunksize={self.chunksize}"
@@ -128,14 +205,19 @@ class ClickHouseLoader:
             log_memory_usage("[ClickHouseLoader] post-load")
             return
 
-        if self.mode == "insert":
-            self._insert(df_db)
-        elif self.mode == "update":
-            self._update(df_db)
-        elif self.mode == "upsert":
-            self._upsert(df_db)
-        else:
-            raise ValueError(f"[ClickHouseLoader] Modalità non supportata: {self.mode}")
+        with clickhouse_client(**self.client_config) as client:
+            self.client = client
+            try:
+                if self.mode == "insert":
+                    self._insert(df_db)
+                elif self.mode == "update":
+                    self._update(df_db)
+                elif self.mode == "upsert":
+                    self._upsert(df_db)
+                else:
+                    raise ValueError(f"[ClickHouseLoader] Modalità non supportata: {self.mode}")
+            finally:
+                self.client = None
 
         log_memory_usage("[ClickHouseLoader] post-load")
 
@@ -160,28 +242,82 @@ class ClickHouseLoader:
         """
         return df.where(pd.notnull(df), None)
 
-    def _iter_chunks(self, df: pd.DataFrame):
-        for start in range(0, len(df), self.chunksize):
-            yield df.iloc[start : start + self.chunksize]
+    def _iter_chunks(self, df: pd.DataFrame, size: Optional[int] = None):
+        size = size or self.chunksize
+        for start in range(0, len(df), size):
+            yield df.iloc[start : start + size]
 
     def _df_to_tuples(self, df: pd.DataFrame) -> List[Tuple[Any, ...]]:
         return [tuple(r) for r in df.itertuples(index=False, name=None)]
 
+    def _df_to_columns(self, df: pd.DataFrame) -> List[list]:
+        """
+        Una lista di valori Python per colonna; NaN/NaT -> None solo dove servono.
+        """
+        columns = []
+        for name in df.columns:
+            s = df[name]
+            nulls = s.isna()
+            if nulls.any():
+                s = s.astype(object).where(~nulls, None)
+            columns.append(s.tolist())
+        return columns
+
     # ------------------------------------------------------------------
     # INSERT
     # ------------------------------------------------------------------
 
-    def _insert(self, df: pd.DataFrame):
+    def _insert(self, df: pd.DataFrame, table: Optional[str] = None, synchronous: bool = False):
+        """
+        :param synchronous: se True ignora async_insert: i dati sono visibili al ritorno
+                            (necessario quando sono riletti subito, es. tabella di staging)
+        """
         cols = ", ".join(df.columns)
-        sql = f"INSERT INTO {self.table_name} ({cols}) VALUES"
+        sql = f"INSERT INTO {table or self.table_name} ({cols}) VALUES"
+        settings = self._insert_settings(synchronous=synchronous)
 
-        inserted = 0
-        for chunk in self._iter_chunks(df):
-            self.client.execute(sql, self._df_to_tuples(chunk))
-            inserted += len(chunk)
+        chunks = self._iter_chunks(df, self.insert_block_size)
+        if self.parallelism > 1:
+            inserted = self._insert_parallel(sql, chunks, settings)
+        else:
+            inserted = 0
+            for chunk in chunks:
+                self._insert_chunk(self.client, sql, chunk, settings)
+                inserted += len(chunk)
 
         self.logger.info(f"[ClickHouseLoader] Inserite {inserted} righe")
 
+    def _insert_parallel(self, sql: str, chunks, settings: dict) -> int:
+        self.logger.info(f"[ClickHouseLoader] Insert parallelo su {self.parallelism} client")
+
+        def insert_one(chunk: pd.DataFrame) -> int:
+            # Un client per thread: clickhouse_driver.Client non è thread-safe
+            with clickhouse_client(max_size=self.parallelism + 1, **self.client_config) as client:
+                self._insert_chunk(client, sql, chunk, settings)
+            return len(chunk)
+
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            return sum(pool.map(insert_one, chunks))
+
+    def _insert_chunk(self, client, sql: str, chunk: pd.DataFrame, settings: dict):
+        if self.use_numpy:
+            client.insert_dataframe(sql, chunk, settings=settings)
+        elif self.columnar:
+            client.execute(sql, self._df_to_columns(chunk), columnar=True, settings=settings)
+        else:
+            client.execute(sql, self._df_to_tuples(chunk), settings=settings)
+
+    def _insert_settings(self, synchronous: bool = False) -> dict:
+        settings = {}
+        if self.use_numpy:
+            settings["use_numpy"] = True
+        if self.async_insert and not synchronous:
+            settings["async_insert"] = 1
+            settings["wait_for_async_insert"] = 1 if self.wait_for_async_insert else 0
+        if self.insert_block_size:
+            settings["insert_block_size"] = self.insert_block_size
+        return settings
+
     # ------------------------------------------------------------------
     # UPDATE (mutation)
     # ------------------------------------------------------------------
@@ -196,6 +332,10 @@ class ClickHouseLoader:
             self.logger.warning("[ClickHouseLoader] Nessuna colonna da aggiornare (solo chiavi).")
             return
 
+        if self.update_strategy == "batch":
+            self._update_batch(df, non_key_cols)
+            return
+
         updated = 0
         for _, row in df.iterrows():
             set_clause = ", ".join(f"{c} = {self._fmt(row[c])}" for c in non_key_cols)
@@ -206,6 +346,66 @@ class ClickHouseLoader:
 
         self.logger.warning(f"[ClickHouseLoader] Richiesti {updated} UPDATE (mutation asincrona)")
 
+    def _update_batch(self, df: pd.DataFrame, non_key_cols: List[str]):
+        """
+        Una mutation per blocco: il valore nuovo è scelto con multiIf sulla chiave,
+        le righe toccate sono filtrate con (chiavi) IN (...).
+        Ogni letterale è convertito con CAST al tipo della colonna (da DESCRIBE TABLE):
+        i rami di multiIf devono avere un supertipo comune con la colonna stessa.
+        """
+        df = df.drop_duplicates(subset=self.unique_keys, keep="last")
+        keys_expr = "(" + ", ".join(self.unique_keys) + ")"
+        types = self._column_types()
+
+        mutations = 0
+        for chunk in self._iter_chunks(df, self.mutation_chunksize):
+            key_literals = [
+                "(" + ", ".join(self._typed(v, types[k]) for k, v in zip(self.unique_keys, t)) + ")"
+                for t in chunk[self.unique_keys].itertuples(index=False, name=None)
+            ]
+
+            assignments = []
+            for col in non_key_cols:
+                branches = ", ".join(
+                    f"{keys_expr} = {key}, {self._typed(value, types[col])}"
+                    for key, value in zip(key_literals, chunk[col].tolist())
+                )
+                assignments.append(f"{col} = multiIf({branches}, {col})")
+
+            sql = (
+                f"ALTER TABLE {self.table_name} UPDATE {', '.join(assignments)} "
+                f"WHERE {keys_expr} IN ({', '.join(key_literals)})"
+            )
+            # Stima dei nodi AST: per riga e colonna un confronto tra tuple + un CAST per valore
+            ast_elements = len(chunk) * (len(non_key_cols) + 1) * (4 * len(self.unique_keys) + 6)
+            self.client.execute(sql, settings=self._query_size_settings(sql, ast_elements))
+            mutations += 1
+
+        self.logger.warning(
+            f"[ClickHouseLoader] Richieste {mutations} mutation UPDATE per {len(df)} righe (mutation asincrone)"
+        )
+
+    def _column_types(self) -> Dict[str, str]:
+        rows = self.client.execute(f"DESCRIBE TABLE {self.table_name}")
+        return {row[0]: row[1] for row in rows}
+
+    def _typed(self, v: Any, col_type: str) -> str:
+        return f"CAST({self._fmt(v)}, {self._fmt(col_type)})"
+
+    @staticmethod
+    def _query_size_settings(sql: str, ast_elements: int = 0) -> dict:
+        # max_query_size (default 256 KiB) limita il testo delle mutation con molti letterali,
+        # max_ast_elements / max_expanded_ast_elements il numero di nodi dell'espressione
+        settings = {}
+        size = len(sql.encode("utf-8")) + 1024
+        if size > 262_144:
+            settings["max_query_size"] = size
+        if ast_elements > 50_000:
+            settings["max_ast_elements"] = ast_elements + 1_000
+        if ast_elements > 500_000:
+            settings["max_expanded_ast_elements"] = ast_elements + 1_000
+        return settings
+
     # ------------------------------------------------------------------
     # UPSERT
     # ------------------------------------------------------------------
@@ -222,19 +422,98 @@ class ClickHouseLoader:
             self.logger.info("[ClickHouseLoader] Upsert via ReplacingMergeTree (INSERT-only)")
             return
 
+        if self.upsert_strategy == "replace_partition":
+            self._upsert_replace_partition(df)
+            return
+
         # delete + insert
+        lightweight = self.upsert_strategy == "lightweight_delete"
         affected = 0
         for chunk in self._iter_chunks(df):
-            self._delete_by_keys(chunk)
+            self._delete_by_keys(chunk, lightweight=lightweight)
             self._insert(chunk)
             affected += len(chunk)
 
         self.logger.info(f"[ClickHouseLoader] Upsert delete+insert su {affected} righe")
 
-    def _delete_by_keys(self, df: pd.DataFrame):
+    def _upsert_replace_partition(self, df: pd.DataFrame):
+        """
+        Upsert per partizione: staging con stessa struttura/partizionamento della
+        target, merge delle righe esistenti non sostituite, REPLACE PARTITION.
+        """
+        staging = f"{self.table_name}_stg_{uuid.uuid4().hex[:8]}"
+        keys_expr = "(" + ", ".join(self.unique_keys) + ")"
+
+        self.client.execute(self._staging_ddl(staging))
+        try:
+            # Sempre sincrono: staging riletta subito (partizioni, merge, REPLACE PARTITION)
+            self._insert(df, table=staging, synchronous=True)
+
+            partitions = [row[0] for row in self.client.execute(
+                f"SELECT DISTINCT _partition_id FROM {staging}"
+            )]
+            if partitions == ["all"]:
+                self.logger.warning("[ClickHouseLoader] Tabella non partizionata: verrà riscritta per intero.")
+
+            ids_expr = ", ".join(self._fmt(p) for p in partitions)
+            self.client.execute(
+                f"INSERT INTO {staging} SELECT * FROM {self.table_name} "
+                f"WHERE _partition_id IN ({ids_expr}) "
+                f"AND {keys_expr} NOT IN (SELECT {', '.join(self.unique_keys)} FROM {staging})"
+            )
+
+            for partition_id in partitions:
+                self.client.execute(
+                    f"ALTER TABLE {self.table_name} REPLACE PARTITION ID {self._fmt(partition_id)} FROM {staging}"
+                )
+        finally:
+            self.client.execute(f"DROP TABLE IF EXISTS {staging}")
+
+        self.logger.info(
+            f"[ClickHouseLoader] Upsert replace_partition: {len(df)} righe, {len(partitions)} partizioni sostituite"
+        )
+
+    def _staging_ddl(self, staging: str) -> str:
+        """
+        CREATE TABLE staging AS target con engine MergeTree semplice: copiare l'engine
+        della target (es. ReplicatedMergeTree con path esplicito) collide con la replica esistente.
+        Chiavi e storage policy restano quelle della target, come richiesto da REPLACE PARTITION.
+        """
+        if "." in self.table_name:
+            database, table = self.table_name.split(".", 1)
+            db_expr = "%(database)s"
+        else:
+            database, table = None, self.table_name
+            db_expr = "currentDatabase()"
+
+        rows = self.client.execute(
+            "SELECT engine, partition_key, sorting_key, primary_key, storage_policy "
+            f"FROM system.tables WHERE database = {db_expr} AND name = %(table)s",
+            {"database": database, "table": table},
+        )
+        if not rows:
+            raise ValueError(f"[ClickHouseLoader] Tabella {self.table_name} non trovata in system.tables")
+
+        engine, partition_key, sorting_key, primary_key, storage_policy = rows[0]
+        if "MergeTree" not in engine:
+            raise ValueError(f"[ClickHouseLoader] replace_partition richiede un engine MergeTree (trovato {engine})")
+
+        ddl = f"CREATE TABLE {staging} AS {self.table_name} ENGINE = MergeTree"
+        if partition_key:
+            ddl += f" PARTITION BY ({partition_key})"
+        ddl += f" ORDER BY ({sorting_key})" if sorting_key else " ORDER BY tuple()"
+        if primary_key and primary_key != sorting_key:
+            ddl += f" PRIMARY KEY ({primary_key})"
+        if storage_policy and storage_policy != "default":
+            ddl += f" SETTINGS storage_policy = {self._fmt(storage_policy)}"
+        return ddl
+
+    def _delete_by_keys(self, df: pd.DataFrame, lightweight: bool = False):
         """
         DELETE a batch usando IN su tuple di chiavi:
           ALTER TABLE t DELETE WHERE (k1, k2) IN ((v11, v12), (v21, v22), ...)
+        oppure, con lightweight=True:
+          DELETE FROM t WHERE (k1, k2) IN (...)
         """
         key_tuples = [
             tuple(row[k] for k in self.unique_keys)
@@ -246,8 +525,11 @@ class ClickHouseLoader:
         keys_expr = "(" + ", ".join(self.unique_keys) + ")"
         tuples_expr = ", ".join(self._fmt_tuple(t) for t in key_tuples)
 
-        sql = f"ALTER TABLE {self.table_name} DELETE WHERE {keys_expr} IN ({tuples_expr})"
-        self.client.execute(sql)
+        if lightweight:
+            sql = f"DELETE FROM {self.table_name} WHERE {keys_expr} IN ({tuples_expr})"
+        else:
+            sql = f"ALTER TABLE {self.table_name} DELETE WHERE {keys_expr} IN ({tuples_expr})"
+        self.client.execute(sql, settings=self._query_size_settings(sql))
 
     # ------------------------------------------------------------------
     # Formatting (solo per comporre mutation/delete)
@@ -257,7 +539,7 @@ class ClickHouseLoader:
         return "(" + ", ".join(self._fmt(v) for v in t) + ")"
 
     def _fmt(self, v: Any) -> str:
-        if v is None:
+        if v is None or v is pd.NaT or v is pd.NA:
             return "NULL"
         if isinstance(v, bool):
             return "1" if v else "0"
@@ -1,11 +1,60 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
 from email import header
 
 from pyflowetl.log import get_logger, log_memory_usage
 
 import math
 
+
+def _write_csv(frame, target, header, encoding, delimiter, writer):
+    """
+    Scrive un DataFrame su un percorso o su un handle già aperto.
+    Funzione di modulo: usata anche dai processi della scrittura parallela.
+    """
+    if writer == "pyarrow":
+        try:
+            import pyarrow as pa
+            import pyarrow.csv as pacsv
+        except ImportError:
+            raise ImportError("[CsvLoader] Installa 'pyarrow' per usare writer='pyarrow'")
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        options = pacsv.WriteOptions(include_header=bool(header), delimiter=delimiter)
+        pacsv.write_csv(table, target, write_options=options)
+    else:
+        frame.to_csv(target, index=False, encoding=encoding, sep=delimiter, header=header)
+    return len(frame)
+
+
+def _write_part(args):
+    frame, path, header, encoding, delimiter, writer = args
+    return path, _write_csv(frame, path, header, encoding, delimiter, writer)
+
+
 class CsvLoader:
+    """
+    Parametri aggiuntivi
+    --------------------
+    append : bool
+        Se True ogni chiamata a load() accoda le righe allo stesso file, tenendo
+        l'handle aperto tra un chunk e l'altro; l'header è scritto una sola volta
+        (solo se il file è nuovo o vuoto). Chiudere con close() o usare il loader
+        come context manager. Non combinabile con rows_per_file.
+    writer : str
+        'pandas' (default, DataFrame.to_csv) oppure 'pyarrow' (pyarrow.csv, multi-thread
+        e molto più veloce sui file grandi; solo UTF-8, booleani scritti come true/false).
+    max_workers : int
+        Con rows_per_file, numero di processi che scrivono i file part in parallelo
+        (default 1 = scrittura sequenziale).
+
+    Esempio (streaming)
+    -------------------
+    with CsvLoader("out/big.csv", append=True, writer="pyarrow") as loader:
+        for chunk in CsvExtractor("in/big.csv", chunksize=500_000).extract_chunks():
+            loader.load(chunk)
+    """
+
     def __init__(
         self,
         output_path,
@@ -14,6 +63,9 @@ class CsvLoader:
         header=True,
         rows_per_file=None,   # <-- numero righe per file (se None: file unico)
         part_digits=4,        # <-- padding: part0001, part0002...
+        append=False,
+        writer="pandas",
+        max_workers=1,
     ):
         self.header = header
         self.output_path = output_path
@@ -21,6 +73,56 @@ class CsvLoader:
         self.delimiter = delimiter
         self.rows_per_file = rows_per_file
         self.part_digits = part_digits
+        self.append = append
+        self.writer = (writer or "pandas").lower()
+        self.max_workers = max(1, int(max_workers or 1))
+        self._handle = None
+        self._header_written = False
+
+        if self.writer not in ("pandas", "pyarrow"):
+            raise ValueError(f"[CsvLoader] writer non supportato: {self.writer}")
+        if self.writer == "pyarrow" and self.encoding.lower().replace("-", "") != "utf8":
+            raise ValueError("[CsvLoader] Il writer 'pyarrow' scrive solo in UTF-8")
+        if self.append and self.rows_per_file is not None:
+            raise ValueError("[CsvLoader] append non è combinabile con rows_per_file")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """
+        Chiude l'handle della modalità append (se aperto).
+        """
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+            get_logger().info(f"[CsvLoader] File chiuso: {self.output_path}")
+
+    def _write(self, frame, target, header):
+        return _write_csv(frame, target, header, self.encoding, self.delimiter, self.writer)
+
+    def _load_append(self, data, logger):
+        if self._handle is None:
+            out_dir = os.path.dirname(self.output_path)
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+            # Header solo se il file è nuovo o vuoto
+            exists = os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0
+            self._header_written = exists or not self.header
+            if self.writer == "pyarrow":
+                self._handle = open(self.output_path, "ab")
+            else:
+                self._handle = open(self.output_path, "a", encoding=self.encoding, newline="")
+            logger.info(f"[CsvLoader] File aperto in append: {self.output_path}")
+
+        written = self._write(data, self._handle, header=self.header if not self._header_written else False)
+        self._header_written = True
+        self._handle.flush()
+        logger.info(f"[CsvLoader] Accodati {written} record a {self.output_path}")
+        log_memory_usage(f"Dopo append su file: {self.output_path}")
 
     def _split_output_path(self, part_index: int) -> str:
         """
@@ -41,6 +143,14 @@ class CsvLoader:
             log_memory_usage(f"Dopo CsvLoader (vuoto): {self.output_path}")
             return
 
+        if self.append:
+            try:
+                self._load_append(data, logger)
+                return
+            except Exception as e:
+                logger.exception(f"[CsvLoader] Errore durante la scrittura in append: {e}")
+                raise
+
         # Se rows_per_file non è impostato -> comportamento originale (file singolo)
         if self.rows_per_file is None:
             logger.info(f"[CsvLoader] Scrittura su file: {self.output_path}")
@@ -49,13 +159,7 @@ class CsvLoader:
                 if out_dir:
                     os.makedirs(out_dir, exist_ok=True)
 
-                data.to_csv(
-                    self.output_path,
-                    index=False,
-                    encoding=self.encoding,
-                    sep=self.delimiter,
-                    header=self.header,
-                )
+                self._write(data, self.output_path, header=self.header)
                 logger.info(f"[CsvLoader] Scrittura completata: {total_rows} record")
                 log_memory_usage(f"Dopo Scrittura su file: {self.output_path}")
                 return
@@ -78,6 +182,11 @@ class CsvLoader:
             if out_dir:
                 os.makedirs(out_dir, exist_ok=True)
 
+            if self.max_workers > 1:
+                self._write_parts_parallel(data, num_parts, logger)
+                logger.info(f"[CsvLoader] Split completato: scritti {num_parts} file, totale {total_rows} record")
+                return
+
             for part in range(1, num_parts + 1):
                 start = (part - 1) * self.rows_per_file
                 end = min(start + self.rows_per_file, total_rows)
@@ -86,13 +195,7 @@ class CsvLoader:
                 logger.info(f"[CsvLoader] Scrittura chunk {part}/{num_parts}: righe {start}:{end} -> {part_path}")
 
                 chunk = data.iloc[start:end]
-                chunk.to_csv(
-                    part_path,
-                    index=False,
-                    encoding=self.encoding,
-                    sep=self.delimiter,
-                    header=self.header,
-                )
+                self._write(chunk, part_path, header=self.header)
 
                 log_memory_usage(f"Dopo Scrittura chunk {part}/{num_parts}: {part_path}")
 
@@ -100,3 +203,21 @@ class CsvLoader:
         except Exception as e:
             logger.exception(f"[CsvLoader] Errore durante lo split/write: {e}")
             raise
+
+    def _write_parts_parallel(self, data, num_parts, logger):
+        """
+        Scrive i file part in processi separati (la formattazione CSV è CPU-bound).
+        """
+        logger.info(f"[CsvLoader] Scrittura parallela dei part con {self.max_workers} processi")
+
+        def tasks():
+            for part in range(1, num_parts + 1):
+                start = (part - 1) * self.rows_per_file
+                chunk = data.iloc[start:start + self.rows_per_file]
+                yield (chunk, self._split_output_path(part), self.header, self.encoding, self.delimiter, self.writer)
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            for n, (part_path, written) in enumerate(pool.map(_write_part, tasks()), start=1):
+                logger.info(f"[CsvLoader] Scritto chunk {n}/{num_parts}: {written} righe -> {part_path}")
+
+        log_memory_usage(f"Dopo scrittura parallela: {self.output_path}")
@@ -25,14 +25,49 @@ class DuckDbLoader:
         Modalità di caricamento: 'insert', 'update', 'upsert'. Default: 'insert'.
 
     chunksize : int, opzionale
-        Righe per batch (usato per l'insert). Default: 500.
+        Righe per batch (usato dall'insert con strategy='row'). Default: 500.
+
+    strategy : str, opzionale
+        'bulk' (default): il DataFrame mappato viene registrato una sola volta in DuckDB
+        e ogni modalità è una singola istruzione set-based, eseguita in parallelo dal motore:
+          - insert: INSERT INTO ... SELECT
+          - upsert: INSERT ... SELECT ... ON CONFLICT DO UPDATE
+          - update: UPDATE ... FROM
+        In upsert/update le righe con la stessa chiave sono deduplicate prima
+        (vince l'ultima occorrenza, come nel caricamento riga per riga).
+        'row': comportamento storico, una vista ogni `chunksize` righe per l'insert
+        e un'istruzione per riga per update/upsert.
+
+    create_table : bool, opzionale
+        Se True e la tabella non esiste (modalità insert/upsert) viene creata dallo
+        schema del DataFrame. Senza `unique_keys` il primo caricamento è un unico
+        CREATE TABLE AS SELECT; con `unique_keys` la tabella è creata con
+        PRIMARY KEY sulle chiavi e poi caricata normalmente. Default: False.
+
+    evolve_schema : bool, opzionale
+        Se True le colonne del DataFrame assenti nella tabella vengono aggiunte
+        (ALTER TABLE ... ADD COLUMN con il tipo dedotto da DuckDB). Default: False.
+
+    threads : int, opzionale
+        SET threads sulla connessione (default: impostazione di DuckDB).
+
+    memory_limit : str, opzionale
+        SET memory_limit (es. '8GB').
+
+    preserve_insertion_order : bool, opzionale
+        Se False DuckDB può caricare senza mantenere l'ordine delle righe:
+        meno memoria e più parallelismo sui carichi grandi. Default: impostazione di DuckDB.
+
+    checkpoint : bool, opzionale
+        Esegue CHECKPOINT a fine load (WAL scritto nel file DB). Default: False.
 
     Note
     ----
     - Per usare la modalità 'upsert' è necessario che sulla tabella target esista
-      un UNIQUE o PRIMARY KEY sulle colonne in `unique_keys`.
-    - Tutte le modalità sono pensate per funzionare con DataFrame ragionevoli;
-      per carichi enormi puoi anche usare direttamente le funzioni di DuckDB
+      un UNIQUE o PRIMARY KEY sulle colonne in `unique_keys` (creato in automatico con create_table).
+    - threads / memory_limit / preserve_insertion_order sono impostazioni della connessione:
+      se la connessione è passata dall'esterno restano attive anche dopo il load.
+    - Per carichi direttamente da file puoi anche usare le funzioni di DuckDB
       (COPY, FROM parquet/csv, ecc.) in pipeline dedicate.
 
     Esempio di utilizzo
@@ -57,7 +92,10 @@ class DuckDbLoader:
     pipeline = EtlPipeline().extract(...).transform(...).load(loader)
     """
 
-    def __init__(self, connection, config: dict, mode: str = "insert", chunksize: int = 500):
+    def __init__(self, connection, config: dict, mode: str = "insert", chunksize: int = 500,
+                 strategy: str = "bulk", create_table: bool = False, evolve_schema: bool = False,
+                 threads: int = None, memory_limit: str = None, preserve_insertion_order: bool = None,
+                 checkpoint: bool = False):
         # Gestione connection: stringa → duckdb.connect, oppure connessione già pronta
         if hasattr(connection, "execute"):
             # Presumo sia una DuckDBPyConnection
@@ -74,8 +112,18 @@ class DuckDbLoader:
         self.columns_mapping = config.get("columns", {})
         self.mode = mode.lower()
         self.chunksize = chunksize
+        self.strategy = strategy.lower()
+        self.create_table = create_table
+        self.evolve_schema = evolve_schema
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self.preserve_insertion_order = preserve_insertion_order
+        self.checkpoint = checkpoint
         self.logger = get_logger()
 
+        if self.strategy not in ("bulk", "row"):
+            raise ValueError(f"[DuckDbLoader] strategy non supportata: {self.strategy}")
+
     def __del__(self):
         # Chiudi la connessione solo se l'abbiamo aperta noi
         try:
@@ -98,21 +146,49 @@ class DuckDbLoader:
         # Applica mapping DataFrame → DB
         df_db = self._apply_mapping(df)
 
-        self.logger.info(f"[DuckDbLoader] Modalità: {self.mode} su tabella {self.table_name} ({len(df_db)} righe)")
+        self.logger.info(
+            f"[DuckDbLoader] Modalità: {self.mode} ({self.strategy}) su tabella {self.table_name} ({len(df_db)} righe)"
+        )
+
+        self._apply_settings()
+
+        if self.create_table and self.mode in ("insert", "upsert") and not self._table_exists():
+            if self._create_table(df_db):
+                # Tabella creata e già popolata con CREATE TABLE AS SELECT
+                self._finish_load()
+                return
+        elif self.evolve_schema:
+            self._add_missing_columns(df_db)
 
+        bulk = self.strategy == "bulk"
         if self.mode == "insert":
-            self._insert(df_db)
+            if bulk:
+                self._insert_bulk(df_db)
+            else:
+                self._insert(df_db)
         elif self.mode == "update":
             if not self.unique_keys:
                 raise ValueError("[DuckDbLoader] Per la modalità 'update' sono richieste le 'unique_keys' nella config")
-            self._update(df_db)
+            if bulk:
+                self._update_bulk(df_db)
+            else:
+                self._update(df_db)
         elif self.mode == "upsert":
             if not self.unique_keys:
                 raise ValueError("[DuckDbLoader] Per la modalità 'upsert' sono richieste le 'unique_keys' nella config")
-            self._upsert(df_db)
+            if bulk:
+                self._upsert_bulk(df_db)
+            else:
+                self._upsert(df_db)
         else:
             raise ValueError(f"[DuckDbLoader] Modalità non supportata: {self.mode}")
 
+        self._finish_load()
+
+    def _finish_load(self):
+        if self.checkpoint:
+            self.con.execute("CHECKPOINT")
+            self.logger.info("[DuckDbLoader] CHECKPOINT eseguito")
         log_memory_usage("[DuckDbLoader] post-load")
 
     def _apply_mapping(self, df: pd.DataFrame) -> pd.DataFrame:
@@ -218,3 +294,160 @@ class DuckDbLoader:
             upserted += 1
 
         self.logger.info(f"[DuckDbLoader] Upsert eseguito su {upserted} righe in {self.table_name}")
+
+    # --------- SCHEMA E IMPOSTAZIONI ---------
+
+    def _apply_settings(self):
+        if self.threads:
+            self.con.execute(f"SET threads = {int(self.threads)}")
+        if self.memory_limit:
+            self.con.execute(f"SET memory_limit = '{self.memory_limit}'")
+        if self.preserve_insertion_order is not None:
+            self.con.execute(f"SET preserve_insertion_order = {'true' if self.preserve_insertion_order else 'false'}")
+
+    def _split_table_name(self):
+        if "." in self.table_name:
+            return self.table_name.rsplit(".", 1)
+        return None, self.table_name
+
+    def _table_exists(self) -> bool:
+        schema, table = self._split_table_name()
+        sql = "SELECT count(*) FROM information_schema.tables WHERE lower(table_name) = lower(?)"
+        params = [table]
+        if schema:
+            sql += " AND lower(table_schema) = lower(?)"
+            params.append(schema)
+        return self.con.execute(sql, params).fetchone()[0] > 0
+
+    def _frame_types(self, view: str) -> list:
+        # DESCRIBE restituisce (column_name, column_type, ...) secondo i tipi dedotti da DuckDB
+        return [(row[0], row[1]) for row in self.con.execute(f"DESCRIBE SELECT * FROM {view}").fetchall()]
+
+    def _create_table(self, df: pd.DataFrame) -> bool:
+        """
+        Crea la tabella dallo schema del DataFrame.
+        Restituisce True se i dati sono già stati caricati (CREATE TABLE AS SELECT).
+        """
+        view = self._register(df)
+        try:
+            if not self.unique_keys:
+                self.con.execute(f"CREATE TABLE {self.table_name} AS SELECT * FROM {view}")
+                self.logger.info(
+                    f"[DuckDbLoader] Tabella {self.table_name} creata con CREATE TABLE AS SELECT ({len(df)} righe)"
+                )
+                return True
+
+            columns = ", ".join([f"{name} {col_type}" for name, col_type in self._frame_types(view)])
+            keys = ", ".join(self.unique_keys)
+            self.con.execute(f"CREATE TABLE {self.table_name} ({columns}, PRIMARY KEY ({keys}))")
+            self.logger.info(f"[DuckDbLoader] Tabella {self.table_name} creata con PRIMARY KEY ({keys})")
+            return False
+        finally:
+            self.con.unregister(view)
+
+    def _add_missing_columns(self, df: pd.DataFrame):
+        schema, table = self._split_table_name()
+        sql = "SELECT column_name FROM information_schema.columns WHERE lower(table_name) = lower(?)"
+        params = [table]
+        if schema:
+            sql += " AND lower(table_schema) = lower(?)"
+            params.append(schema)
+        existing = {row[0].lower() for row in self.con.execute(sql, params).fetchall()}
+
+        missing = [c for c in df.columns if str(c).lower() not in existing]
+        if not missing:
+            return
+
+        view = self._register(df[missing])
+        try:
+            for name, col_type in self._frame_types(view):
+                self.con.execute(f"ALTER TABLE {self.table_name} ADD COLUMN {name} {col_type}")
+                self.logger.info(f"[DuckDbLoader] Aggiunta colonna {name} {col_type} a {self.table_name}")
+        finally:
+            self.con.unregister(view)
+
+    # --------- STRATEGIA BULK ---------
+
+    def _register(self, df: pd.DataFrame) -> str:
+        """
+        Registra il DataFrame intero come vista temporanea (scansione diretta, senza copia).
+        """
+        view = f"_tmp_df_{uuid.uuid4().hex[:8]}"
+        self.con.register(view, df)
+        return view
+
+    def _dedup_keys(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Una sola riga per chiave: ON CONFLICT / UPDATE FROM non accettano la stessa chiave due volte
+        deduped = df.drop_duplicates(subset=self.unique_keys, keep="last")
+        if len(deduped) < len(df):
+            self.logger.info(f"[DuckDbLoader] Scartate {len(df) - len(deduped)} righe con chiave duplicata")
+        return deduped
+
+    def _execute_count(self, sql: str) -> int:
+        # Le istruzioni DML di DuckDB restituiscono il numero di righe toccate
+        row = self.con.execute(sql).fetchone()
+        return int(row[0]) if row else 0
+
+    def _insert_bulk(self, df: pd.DataFrame):
+        """
+        Un solo INSERT INTO ... SELECT sull'intero DataFrame.
+        """
+        view = self._register(df)
+        try:
+            cols = ", ".join(df.columns)
+            inserted = self._execute_count(
+                f"INSERT INTO {self.table_name} ({cols}) SELECT {cols} FROM {view}"
+            )
+        finally:
+            self.con.unregister(view)
+
+        self.logger.info(f"[DuckDbLoader] Inserite {inserted} righe in {self.table_name}")
+
+    def _update_bulk(self, df: pd.DataFrame):
+        """
+        Un solo UPDATE target SET ... FROM vista WHERE chiavi uguali.
+        """
+        non_key_cols = [c for c in df.columns if c not in self.unique_keys]
+        if not non_key_cols:
+            self.logger.warning("[DuckDbLoader] Nessuna colonna da aggiornare (tutte sono chiavi uniche?)")
+            return
+
+        df = self._dedup_keys(df)
+        view = self._register(df)
+        try:
+            set_clause = ", ".join([f"{col} = s.{col}" for col in non_key_cols])
+            where_clause = " AND ".join([f"t.{col} = s.{col}" for col in self.unique_keys])
+            updated = self._execute_count(
+                f"UPDATE {self.table_name} AS t SET {set_clause} FROM {view} AS s WHERE {where_clause}"
+            )
+        finally:
+            self.con.unregister(view)
+
+        self.logger.info(
+            f"[DuckDbLoader] Aggiornate {updated} righe in {self.table_name} "
+            f"({len(df) - updated} chiavi non trovate)"
+        )
+
+    def _upsert_bulk(self, df: pd.DataFrame):
+        """
+        Un solo INSERT ... SELECT ... ON CONFLICT DO UPDATE sull'intero DataFrame.
+        """
+        columns = list(df.columns)
+        cols = ", ".join(columns)
+        conflict_cols = ", ".join(self.unique_keys)
+        update_assignments = ", ".join([
+            f"{col} = EXCLUDED.{col}" for col in columns if col not in self.unique_keys
+        ])
+        on_conflict = f"DO UPDATE SET {update_assignments}" if update_assignments else "DO NOTHING"
+
+        df = self._dedup_keys(df)
+        view = self._register(df)
+        try:
+            upserted = self._execute_count(
+                f"INSERT INTO {self.table_name} ({cols}) SELECT {cols} FROM {view} "
+                f"ON CONFLICT ({conflict_cols}) {on_conflict}"
+            )
+        finally:
+            self.con.unregister(view)
+
+        self.logger.info(f"[DuckDbLoader] Upsert eseguito su {upserted} righe in {self.table_name}")
@@ -1,5 +1,45 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from psycopg2.extras import execute_values
 from pyflowetl.log import get_logger, log_memory_usage
-import psycopg2
+from pyflowetl.connections import get_engine
+
+
+class _ParentIdCache:
+    """
+    Cache LRU limitata: chiave normalizzata del padre → id restituito dal DB.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys) -> dict:
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+        return found
+
+    def put_many(self, mapping: dict):
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
 
 
 class ParentChildUpsertLoader:
@@ -33,6 +73,19 @@ class ParentChildUpsertLoader:
 
     batch_size : int, opzionale
         Numero di righe da processare per ogni batch (default: 1000).
+        Ogni batch richiede due statement: upsert dei padri distinti (con RETURNING)
+        e upsert di tutti i figli.
+
+    parent_cache_size : int, opzionale
+        Dimensione della cache LRU chiave padre → id (default: 100_000; 0 = disattivata).
+        La cache vale per tutti i batch di un load: un padre già scritto nello stesso
+        load non viene riscritto (vale quindi la prima occorrenza tra batch diversi,
+        l'ultima dentro lo stesso batch).
+
+    share_parent_cache : bool, opzionale
+        Se True la cache è condivisa tra i load dello stesso processo (per stessa
+        connessione e tabella padre). Utile quando più load consecutivi toccano gli
+        stessi padri; presuppone che gli attributi del padre non cambino tra un load e l'altro.
 
     Ritorno
     -------
@@ -44,6 +97,9 @@ class ParentChildUpsertLoader:
     - Le colonne del DataFrame devono essere mappate tramite la chiave
       `columns` verso le colonne del DB.
     - La foreign key è completamente indipendente dai nomi presenti nel DataFrame.
+    - L'id del padre è associato alle righe dal DB (chiavi convertite ai tipi delle
+      colonne): se un figlio resta senza id padre il load fallisce con ValueError
+      e la transazione viene annullata, senza scrivere figli orfani.
 
     Esempio di utilizzo
     -------------------
@@ -86,67 +142,212 @@ class ParentChildUpsertLoader:
         .load(loader)
     """
 
-    def __init__(self, connection_string: str, parent_config: dict, child_config: dict, batch_size: int = 1000):
+    _shared_caches = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, connection_string: str, parent_config: dict, child_config: dict, batch_size: int = 1000,
+                 parent_cache_size: int = 100_000, share_parent_cache: bool = False):
         self.connection_string = connection_string
         self.parent_config = parent_config
         self.child_config = child_config
         self.batch_size = batch_size
+        self.parent_cache_size = parent_cache_size
+        self.share_parent_cache = share_parent_cache
         self.logger = get_logger()
+        self._parent_cache = None
+        self._types_cache = {}
+
+    def _get_parent_cache(self):
+        if not self.parent_cache_size:
+            return None
+        if not self.share_parent_cache:
+            # Cache nuova a ogni load: vale solo tra i batch dello stesso load
+            return _ParentIdCache(self.parent_cache_size)
+
+        key = (self.connection_string, self.parent_config["table"])
+        with self._shared_lock:
+            cache = self._shared_caches.get(key)
+            if cache is None:
+                cache = _ParentIdCache(self.parent_cache_size)
+                self._shared_caches[key] = cache
+            return cache
 
     def load(self, df):
         self.logger.info("[ParentChildUpsertLoader] Inizio upsert padre/figlio...")
-        with psycopg2.connect(self.connection_string) as conn:
+        # Connessione psycopg2 presa dal pool condiviso (pyflowetl.connections)
+        conn = get_engine(self.connection_string).raw_connection()
+        self._parent_cache = self._get_parent_cache()
+        try:
             for start in range(0, len(df), self.batch_size):
                 batch = df.iloc[start:start + self.batch_size]
-                for _, row in batch.iterrows():
-                    parent_data = self._map_row(row, self.parent_config["columns"])
-                    parent_keys = self._upsert(conn, self.parent_config, parent_data)
+                with conn.cursor() as cur:
+                    n_parents, n_children = self._load_batch(cur, batch)
+                self.logger.info(
+                    f"[ParentChildUpsertLoader] Batch {start}: {n_parents} padri, {n_children} figli"
+                )
+                log_memory_usage(f"[ParentChildUpsertLoader] dopo batch {start}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Gli id in cache potrebbero venire da righe annullate dal rollback
+            if self._parent_cache is not None:
+                self._parent_cache.clear()
+            raise
+        finally:
+            conn.close()
+        self.logger.info("[ParentChildUpsertLoader] Fine upsert padre/figlio")
 
-                    child_data = self._map_row(row, self.child_config["columns"])
+    def _load_batch(self, cur, batch: pd.DataFrame):
+        """
+        Un batch in ~2 round trip:
+          1. upsert set-based dei padri distinti non ancora in cache; il DB restituisce
+             l'id per posizione di ogni riga in input (chiavi confrontate già convertite
+             ai tipi delle colonne, vedi _upsert_parents)
+          2. FK assegnata con una map vettoriale chiave → id
+          3. upsert set-based di tutti i figli
+        """
+        fk = self.child_config["foreign_key"]
+        parent_keys = self.parent_config["unique_keys"]
 
-                    # Foreign key handling
-                    fk = self.child_config["foreign_key"]
-                    child_data[fk["db_column"]] = parent_keys[fk["parent_db_column"]] \
-                        if isinstance(parent_keys, dict) else parent_keys
+        parent_df = self._map_frame(batch, self.parent_config["columns"])
+        key_series = self._key_series(parent_df, parent_keys)
 
-                    self._upsert(conn, self.child_config, child_data)
+        # Dedup dei padri nel batch (vince l'ultima occorrenza) ed esclusione di quelli già in cache
+        last_rows = ~key_series.duplicated(keep="last")
+        parents = parent_df[last_rows]
+        parent_key_values = key_series[last_rows]
 
-                log_memory_usage(f"[ParentChildUpsertLoader] dopo batch {start}")
-        self.logger.info("[ParentChildUpsertLoader] Fine upsert padre/figlio")
+        id_by_key = self._parent_cache.get_many(parent_key_values) if self._parent_cache is not None else {}
+        if id_by_key:
+            uncached = ~parent_key_values.isin(list(id_by_key.keys()))
+            parents = parents[uncached]
+            parent_key_values = parent_key_values[uncached]
+
+        ids = self._upsert_parents(cur, parents, fk["parent_db_column"])
+        new_ids = {key: parent_id for key, parent_id in zip(parent_key_values, ids) if parent_id is not None}
+        if self._parent_cache is not None:
+            self._parent_cache.put_many(new_ids)
+        id_by_key.update(new_ids)
+
+        fk_values = key_series.map(id_by_key)
+        missing = int(fk_values.isna().sum())
+        if missing:
+            # Nessun figlio orfano: il batch (e la transazione) falliscono
+            raise ValueError(f"[ParentChildUpsertLoader] {missing} figli senza id padre (chiavi padre nulle o non risolte)")
 
-    def _map_row(self, row, mapping):
-        return {db_col: row[src_col] for src_col, db_col in mapping.items() if src_col in row}
+        child_df = self._map_frame(batch, self.child_config["columns"])
+        # tolist(): id come tipi Python nativi, senza passare per float64
+        child_df[fk["db_column"]] = fk_values.tolist()
 
-    def _upsert(self, conn, config, data):
-        cols = data.keys()
-        values = [data[c] for c in cols]
+        children = child_df.drop_duplicates(subset=self.child_config["unique_keys"], keep="last")
+        self._upsert_many(cur, self.child_config, children)
+        return len(parents), len(children)
+
+    def _map_frame(self, df: pd.DataFrame, mapping: dict) -> pd.DataFrame:
+        mapped = {src_col: db_col for src_col, db_col in mapping.items() if src_col in df.columns}
+        return df[list(mapped.keys())].rename(columns=mapped).reset_index(drop=True)
+
+    @staticmethod
+    def _key(values) -> str:
+        """
+        Chiave normalizzata (stringa) per raggruppare le righe del DataFrame
+        (dedup nel batch e cache). Il confronto con i valori del DB avviene lato server.
+        """
+        normalized = []
+        for v in values:
+            if isinstance(v, float) and v.is_integer():
+                v = int(v)
+            normalized.append("\x00" if v is None else str(v))
+        return "\x1f".join(normalized)
+
+    def _key_series(self, df: pd.DataFrame, keys: list) -> pd.Series:
+        records = df[keys].astype(object).where(pd.notnull(df[keys]), None).itertuples(index=False, name=None)
+        return pd.Series([self._key(r) for r in records], index=df.index, dtype=object)
+
+    @staticmethod
+    def _records(df: pd.DataFrame) -> list:
+        # astype(object): tipi Python nativi (psycopg2 non adatta i tipi numpy), NaN → NULL
+        return list(df.astype(object).where(pd.notnull(df), None).itertuples(index=False, name=None))
+
+    def _column_types(self, cur, table: str) -> dict:
+        if table not in self._types_cache:
+            cur.execute(
+                "SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+                "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped",
+                (table,),
+            )
+            self._types_cache[table] = dict(cur.fetchall())
+        return self._types_cache[table]
+
+    def _upsert_parents(self, cur, parents: pd.DataFrame, id_column: str) -> list:
+        """
+        Upsert dei padri con risoluzione delle chiavi lato DB. Restituisce gli id
+        nello stesso ordine delle righe di `parents` (None se non risolto).
+
+        I valori in input sono convertiti con CAST ai tipi delle colonne prima del
+        confronto, quindi '0123' nel CSV trova 123 in una colonna integer (lo stesso
+        vale per scale numeriche, char(n), formati data). Righe in input che dopo il
+        CAST hanno la stessa chiave sono scritte una volta sola (vince l'ultima).
+        """
+        if parents.empty:
+            return []
+
+        table = self.parent_config["table"]
+        unique_keys = self.parent_config["unique_keys"]
+        types = self._column_types(cur, table)
+        cols = list(parents.columns)
+        unknown = [c for c in cols if c not in types]
+        if unknown:
+            raise ValueError(f"[ParentChildUpsertLoader] Colonne {unknown} non trovate nella tabella {table}")
+
+        casts = ", ".join([f"CAST({c} AS {types[c]}) AS {c}" for c in cols])
+        keys = ", ".join(unique_keys)
+        updates = ", ".join([f"{c}=EXCLUDED.{c}" for c in cols if c not in unique_keys])
+        if not updates:
+            # DO NOTHING non restituisce le righe esistenti: aggiornamento "a vuoto" sulla chiave
+            updates = f"{unique_keys[0]}=EXCLUDED.{unique_keys[0]}"
+        join = " AND ".join([f"t.{k} IS NOT DISTINCT FROM u.{k}" for k in unique_keys])
+
+        sql = f"""
+        WITH input (_ord, {", ".join(cols)}) AS (VALUES %s),
+        typed AS (SELECT _ord, {casts} FROM input),
+        latest AS (SELECT DISTINCT ON ({keys}) * FROM typed ORDER BY {keys}, _ord DESC),
+        upserted AS (
+            INSERT INTO {table} ({", ".join(cols)})
+            SELECT {", ".join(cols)} FROM latest
+            ON CONFLICT ({keys})
+            DO UPDATE SET {updates}
+            RETURNING {", ".join(dict.fromkeys(unique_keys + [id_column]))}
+        )
+        SELECT t._ord, u.{id_column} FROM typed t JOIN upserted u ON {join}
+        """
+
+        rows = [(i,) + row for i, row in enumerate(self._records(parents))]
+        result = execute_values(cur, sql, rows, page_size=len(rows), fetch=True)
+
+        ids = [None] * len(rows)
+        for ordinal, parent_id in result:
+            ids[ordinal] = parent_id
+        return ids
+
+    def _upsert_many(self, cur, config, df: pd.DataFrame):
+        if df.empty:
+            return
+
+        cols = list(df.columns)
         table = config["table"]
         unique_keys = config["unique_keys"]
 
-        insert_cols = ", ".join(cols)
-        placeholders = ", ".join(["%s"] * len(cols))
         updates = ", ".join([f"{c}=EXCLUDED.{c}" for c in cols if c not in unique_keys])
+        action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
         conflict = ", ".join(unique_keys)
 
-        # ritorniamo tutte le unique_keys + la PK 'id' se presente
-        returning_cols = list(unique_keys)
-        if "id" not in returning_cols:
-            returning_cols.append("id")
-        returning_cols_sql = ", ".join(returning_cols)
-
         sql = f"""
-        INSERT INTO {table} ({insert_cols})
-        VALUES ({placeholders})
+        INSERT INTO {table} ({", ".join(cols)})
+        VALUES %s
         ON CONFLICT ({conflict})
-        DO UPDATE SET {updates}
-        RETURNING {returning_cols_sql};
+        {action}
         """
-        with conn.cursor() as cur:
-            cur.execute(sql, values)
-            result = cur.fetchone()
-
-            # Se c'è solo una colonna ritorna il valore, altrimenti un dict
-            if len(cur.description) == 1:
-                return result[0]
-            else:
-                return {desc[0]: val for desc, val in zip(cur.description, result)}
+
+        rows = self._records(df)
+        execute_values(cur, sql, rows, page_size=len(rows))
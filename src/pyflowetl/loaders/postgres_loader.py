@@ -1,5 +1,10 @@
+import io
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from pyflowetl.connections import get_engine
 from pyflowetl.log import get_logger, log_memory_usage
 
 
@@ -25,6 +30,35 @@ class PostgresLoader:
     chunksize : int, opzionale
         Righe per batch. Default: 500.
 
+    insert_method : str, opzionale
+        'to_sql' (default, INSERT parametrizzati) oppure 'copy': COPY FROM STDIN
+        in CSV da un buffer in memoria, un blocco di `copy_chunksize` righe alla volta.
+        Tipicamente 10-50x più veloce sui caricamenti massivi.
+
+    copy_chunksize : int, opzionale
+        Righe per blocco COPY (limita la memoria del buffer CSV). Default: 100_000.
+        È anche la dimensione dei batch delle strategie 'staging'.
+
+    upsert_strategy : str, opzionale
+        'row' (default): un INSERT ... ON CONFLICT per riga.
+        'staging': per ogni batch COPY in una tabella temporanea, deduplica su
+        `unique_keys` (vince l'ultima occorrenza) e un solo
+        INSERT ... SELECT ... ON CONFLICT DO UPDATE. Righe inserite/aggiornate
+        sono riportate nel log e in `self.stats`.
+
+    update_strategy : str, opzionale
+        'row' (default): un UPDATE per riga.
+        'staging': per ogni batch COPY in una tabella temporanea e un solo
+        UPDATE target SET ... FROM staging WHERE chiavi uguali. Chiavi trovate
+        e non trovate sono riportate nel log e in `self.stats`.
+
+    parallelism : int, opzionale
+        Numero di connessioni in parallelo (default 1). Le righe sono ripartite
+        per hash di `unique_keys`, quindi nessuna chiave finisce su due worker
+        (niente deadlock tra partizioni); senza chiavi la ripartizione è per blocchi.
+        Ogni partizione è caricata in una propria transazione: in caso di errore
+        le partizioni già completate restano committate.
+
     Esempio di utilizzo
     -------------------
     config = {
@@ -46,32 +80,93 @@ class PostgresLoader:
     pipeline = EtlPipeline().extract(...).transform(...).load(loader)
     """
 
-    def __init__(self, connection_string: str, config: dict, mode: str = "insert", chunksize: int = 500):
-        self.engine = create_engine(connection_string)
+    def __init__(self, connection_string: str, config: dict, mode: str = "insert", chunksize: int = 500,
+                 insert_method: str = "to_sql", copy_chunksize: int = 100_000,
+                 upsert_strategy: str = "row", update_strategy: str = "row", parallelism: int = 1):
+        self.parallelism = max(1, int(parallelism))
+        self.engine = get_engine(connection_string, pool_size=self.parallelism)
         self.config = config
         self.table_name = config["table"]
         self.unique_keys = config.get("unique_keys", [])
         self.columns_mapping = config.get("columns", {})
         self.mode = mode.lower()
         self.chunksize = chunksize
+        self.insert_method = insert_method.lower()
+        self.copy_chunksize = copy_chunksize
+        self.upsert_strategy = upsert_strategy.lower()
+        self.update_strategy = update_strategy.lower()
+        self.stats = {}
         self.logger = get_logger()
 
+        if self.insert_method not in ("to_sql", "copy"):
+            raise ValueError(f"[PostgresLoader] insert_method non supportato: {self.insert_method}")
+        if self.upsert_strategy not in ("row", "staging"):
+            raise ValueError(f"[PostgresLoader] upsert_strategy non supportata: {self.upsert_strategy}")
+        if self.update_strategy not in ("row", "staging"):
+            raise ValueError(f"[PostgresLoader] update_strategy non supportata: {self.update_strategy}")
+
     def load(self, df: pd.DataFrame):
         # Applica mapping DataFrame → DB
         df_db = self._apply_mapping(df)
 
         self.logger.info(f"[PostgresLoader] Modalità: {self.mode} su tabella {self.table_name}")
-        if self.mode == "insert":
-            self._insert(df_db)
-        elif self.mode == "update":
-            self._update(df_db)
-        elif self.mode == "upsert":
-            self._upsert(df_db)
-        else:
+        if self.mode not in ("insert", "update", "upsert"):
             raise ValueError(f"[PostgresLoader] Modalità non supportata: {self.mode}")
 
+        if self.parallelism > 1 and len(df_db) > 1:
+            self.stats = self._load_parallel(df_db)
+        else:
+            self.stats = self._load_partition(df_db)
+
         log_memory_usage("[PostgresLoader] post-load")
 
+    def _load_partition(self, df: pd.DataFrame) -> dict:
+        if self.mode == "insert":
+            return self._insert(df)
+        if self.mode == "update":
+            return self._update(df)
+        return self._upsert(df)
+
+    def _partition(self, df: pd.DataFrame) -> list:
+        n = self.parallelism
+        if self.unique_keys and all(k in df.columns for k in self.unique_keys):
+            buckets = (pd.util.hash_pandas_object(df[self.unique_keys], index=False) % n).to_numpy()
+        else:
+            buckets = np.arange(len(df)) * n // len(df)
+        return [df[buckets == i] for i in range(n)]
+
+    def _load_parallel(self, df: pd.DataFrame) -> dict:
+        partitions = [p for p in self._partition(df) if not p.empty]
+        self.logger.info(
+            f"[PostgresLoader] Caricamento parallelo: {len(df)} righe in {len(partitions)} partizioni"
+        )
+
+        def load_one(item):
+            i, part = item
+            stats = self._load_partition(part)
+            self.logger.info(f"[PostgresLoader] Partizione {i + 1}/{len(partitions)} completata: {stats}")
+            return stats
+
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            futures = [pool.submit(load_one, item) for item in enumerate(partitions)]
+            results, errors = [], []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+
+        if errors:
+            self.logger.error(f"[PostgresLoader] {len(errors)} partizioni fallite su {len(partitions)}")
+            raise errors[0]
+
+        totals = {}
+        for stats in results:
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+        self.logger.info(f"[PostgresLoader] Totale: {totals}")
+        return totals
+
     def _apply_mapping(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Rinomina le colonne del DataFrame in base alla mappatura dataset→DB
@@ -87,10 +182,64 @@ class PostgresLoader:
         return df[list(mapped_cols.keys())].rename(columns=mapped_cols)
 
     def _insert(self, df: pd.DataFrame):
+        if self.insert_method == "copy":
+            with self.engine.begin() as conn:
+                with conn.connection.cursor() as cur:
+                    self._copy_df(cur, self.table_name, df)
+            self.logger.info(f"[PostgresLoader] Inserite {len(df)} righe (COPY)")
+            return {"rows": len(df), "inserted": len(df)}
+
         df.to_sql(self.table_name, con=self.engine, if_exists="append", index=False, chunksize=self.chunksize)
         self.logger.info(f"[PostgresLoader] Inserite {len(df)} righe")
+        return {"rows": len(df), "inserted": len(df)}
+
+    def _copy_df(self, cur, table: str, df: pd.DataFrame):
+        """
+        COPY FROM STDIN in CSV, a blocchi di copy_chunksize righe:
+        ogni blocco è serializzato in un buffer in memoria e poi inviato al server.
+        I valori nulli viaggiano come \\N, così le stringhe vuote restano stringhe vuote.
+        """
+        df = self._integral_floats_to_int(df)
+        cols = ", ".join(df.columns)
+        sql = f"COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+
+        for start in range(0, len(df), self.copy_chunksize):
+            chunk = df.iloc[start:start + self.copy_chunksize]
+            buffer = io.StringIO()
+            chunk.to_csv(buffer, index=False, header=False, na_rep="\\N")
+            buffer.seek(0)
+            cur.copy_expert(sql, buffer)
+
+    @staticmethod
+    def _integral_floats_to_int(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Colonne float con soli valori interi (tipicamente interi con NaN) → Int64 nullable:
+        altrimenti to_csv scrive '1.0' e la COPY su colonne integer/bigint fallisce.
+        """
+        converted = {}
+        for col in df.columns:
+            s = df[col]
+            if s.dtype.kind != "f":
+                continue
+            values = s.dropna().to_numpy()
+            if len(values) == 0 or not np.isfinite(values).all() or not (values == np.floor(values)).all():
+                continue
+            try:
+                converted[col] = s.astype("Int64")
+            except (TypeError, ValueError, OverflowError):
+                continue
+
+        if not converted:
+            return df
+        df = df.copy()
+        for col, s in converted.items():
+            df[col] = s
+        return df
 
     def _update(self, df: pd.DataFrame):
+        if self.update_strategy == "staging":
+            return self._update_staging(df)
+
         with self.engine.begin() as conn:
             for _, row in df.iterrows():
                 set_clause = ", ".join([f"{col} = :{col}" for col in df.columns if col not in self.unique_keys])
@@ -98,8 +247,30 @@ class PostgresLoader:
                 sql = f"UPDATE {self.table_name} SET {set_clause} WHERE {where_clause}"
                 conn.execute(text(sql), row.to_dict())
         self.logger.info(f"[PostgresLoader] Aggiornate {len(df)} righe")
+        return {"rows": len(df)}
+
+    def _create_staging(self, cur, columns: list) -> str:
+        """
+        Tabella temporanea con le sole colonne caricate (stessi tipi della target,
+        senza vincoli) più un progressivo per sapere quale riga è arrivata per ultima.
+        Viene eliminata a fine transazione.
+        """
+        staging = f"_stg_{uuid.uuid4().hex[:12]}"
+        cur.execute(
+            f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+            f"SELECT {', '.join(columns)} FROM {self.table_name} WITH NO DATA"
+        )
+        cur.execute(f"ALTER TABLE {staging} ADD COLUMN _stg_row BIGSERIAL")
+        return staging
+
+    def _iter_batches(self, df: pd.DataFrame):
+        for start in range(0, len(df), self.copy_chunksize):
+            yield df.iloc[start:start + self.copy_chunksize]
 
     def _upsert(self, df: pd.DataFrame):
+        if self.upsert_strategy == "staging":
+            return self._upsert_staging(df)
+
         with self.engine.begin() as conn:
             for _, row in df.iterrows():
                 columns = list(row.keys())
@@ -113,3 +284,91 @@ class PostgresLoader:
                 """
                 conn.execute(text(sql), row.to_dict())
         self.logger.info(f"[PostgresLoader] Upsert su {len(df)} righe")
+        return {"rows": len(df)}
+
+    def _upsert_staging(self, df: pd.DataFrame):
+        columns = list(df.columns)
+        keys = ", ".join(self.unique_keys)
+        cols = ", ".join(columns)
+        updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in columns if col not in self.unique_keys)
+        on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+
+        inserted = updated = 0
+        with self.engine.begin() as conn:
+            with conn.connection.cursor() as cur:
+                staging = self._create_staging(cur, columns)
+
+                # xmax = 0 solo sulle righe appena inserite: distingue insert da update
+                sql = f"""
+                    WITH up AS (
+                        INSERT INTO {self.table_name} ({cols})
+                        SELECT DISTINCT ON ({keys}) {cols}
+                        FROM {staging}
+                        ORDER BY {keys}, _stg_row DESC
+                        ON CONFLICT ({keys}) {on_conflict}
+                        RETURNING (xmax = 0) AS inserted
+                    )
+                    SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM up
+                """
+
+                for batch in self._iter_batches(df):
+                    cur.execute(f"TRUNCATE {staging}")
+                    self._copy_df(cur, staging, batch)
+                    cur.execute(sql)
+                    batch_inserted, batch_updated = cur.fetchone()
+                    inserted += batch_inserted
+                    updated += batch_updated
+
+        self.logger.info(
+            f"[PostgresLoader] Upsert (staging) su {len(df)} righe: {inserted} inserite, {updated} aggiornate"
+        )
+        return {"rows": len(df), "inserted": inserted, "updated": updated}
+
+    def _update_staging(self, df: pd.DataFrame):
+        columns = list(df.columns)
+        non_key_cols = [col for col in columns if col not in self.unique_keys]
+        if not non_key_cols:
+            self.logger.warning("[PostgresLoader] Nessuna colonna da aggiornare (solo chiavi)")
+            return {"rows": len(df)}
+
+        keys = ", ".join(self.unique_keys)
+        cols = ", ".join(columns)
+        set_clause = ", ".join(f"{col} = s.{col}" for col in non_key_cols)
+        match = " AND ".join(f"t.{k} = s.{k}" for k in self.unique_keys)
+
+        matched = unmatched = 0
+        with self.engine.begin() as conn:
+            with conn.connection.cursor() as cur:
+                staging = self._create_staging(cur, columns)
+
+                update_sql = f"""
+                    UPDATE {self.table_name} AS t SET {set_clause}
+                    FROM (
+                        SELECT DISTINCT ON ({keys}) {cols}
+                        FROM {staging}
+                        ORDER BY {keys}, _stg_row DESC
+                    ) AS s
+                    WHERE {match}
+                """
+                unmatched_sql = f"""
+                    SELECT COUNT(*) FROM (SELECT DISTINCT {keys} FROM {staging}) AS s
+                    WHERE NOT EXISTS (SELECT 1 FROM {self.table_name} AS t WHERE {match})
+                """
+                distinct_sql = f"SELECT COUNT(*) FROM (SELECT DISTINCT {keys} FROM {staging}) AS s"
+
+                for batch in self._iter_batches(df):
+                    cur.execute(f"TRUNCATE {staging}")
+                    self._copy_df(cur, staging, batch)
+                    cur.execute(update_sql)
+                    cur.execute(unmatched_sql)
+                    batch_unmatched = cur.fetchone()[0]
+                    cur.execute(distinct_sql)
+                    matched += cur.fetchone()[0] - batch_unmatched
+                    unmatched += batch_unmatched
+
+        self.logger.info(
+            f"[PostgresLoader] Update (staging) su {len(df)} righe: {matched} chiavi trovate, {unmatched} non trovate"
+        )
+        if unmatched:
+            self.logger.warning(f"[PostgresLoader] {unmatched} chiavi non presenti in {self.table_name}")
+        return {"rows": len(df), "matched": matched, "unmatched": unmatched}
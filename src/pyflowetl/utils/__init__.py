@@ -1,5 +1,13 @@
 from .string_cleaner import clean_string
+from .encoding_detector import EncodingDetector, detect_file_encoding
+from .watermark_store import WatermarkStore, max_watermark
+from .query_cache import QueryResultCache
 
 __all__ = [
     "clean_string",
+    "EncodingDetector",
+    "detect_file_encoding",
+    "WatermarkStore",
+    "max_watermark",
+    "QueryResultCache",
 ]
@@ -0,0 +1,178 @@
+import json
+import mmap
+import os
+import threading
+
+import chardet
+
+from pyflowetl.log import get_logger
+
+
+class EncodingDetector:
+    """
+    Rilevamento encoding veloce per file di testo (CSV).
+
+    - Campiona testa, centro e coda del file tramite mmap (niente letture complete).
+    - Mette in cache il risultato per "impronta" del file (path + size + mtime):
+      esecuzioni ripetute sullo stesso file non pagano di nuovo chardet.
+      La cache ha due livelli: dizionario in memoria (processo) e un piccolo file
+      JSON su disco (cache_path), scritto in modo atomico, che vale anche tra
+      esecuzioni diverse (es. run notturni sullo stesso drop).
+
+    Esempio
+    -------
+    detector = EncodingDetector(sample_size=64_000)
+    encoding, confidence = detector.detect("input/anagrafiche.csv")
+    """
+
+    _cache = {}
+    _loaded_paths = set()
+    _lock = threading.Lock()
+
+    MAX_PERSISTED = 10_000
+
+    def __init__(self, sample_size: int = 64_000, cache_path: str = ".pyflowetl_encodings.json"):
+        """
+        :param sample_size: byte letti per ciascun campione (testa, centro, coda)
+        :param cache_path: file JSON della cache persistente (None = solo cache in memoria)
+        """
+        self.sample_size = sample_size
+        self.cache_path = cache_path
+        self.logger = get_logger()
+
+    @staticmethod
+    def fingerprint(filepath: str) -> tuple:
+        st = os.stat(filepath)
+        return os.path.abspath(filepath), st.st_size, st.st_mtime_ns
+
+    @classmethod
+    def clear_cache(cls):
+        """
+        Svuota la cache in memoria (il file su disco non viene toccato).
+        """
+        with cls._lock:
+            cls._cache.clear()
+            cls._loaded_paths.clear()
+
+    def detect(self, filepath: str) -> tuple:
+        """
+        Restituisce (encoding, confidence). encoding può essere None se chardet non decide.
+        """
+        key = self.fingerprint(filepath)
+        cached = self._cached(key)
+        if cached is not None:
+            self.logger.info(f"[EncodingDetector] Encoding da cache per {filepath}: {cached[0]}")
+            return cached
+
+        return self.detect_bytes(self._sample(filepath, key[1]), key=key)
+
+    def detect_stream(self, stream, key: tuple = None) -> tuple:
+        """
+        Variante per stream non mappabili (es. file compressi): campiona solo la testa.
+        :param key: impronta per la cache (es. fingerprint del file compresso + membro)
+        """
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        raw = stream.read(self.sample_size * 3)
+        return self.detect_bytes(self._trim_to_lines(raw, keep_start=True), key=key)
+
+    def detect_bytes(self, raw: bytes, key: tuple = None) -> tuple:
+        result = chardet.detect(raw) if raw else {"encoding": "utf-8", "confidence": 1.0}
+        verdict = (result["encoding"], result["confidence"] or 0.0)
+
+        if key is not None:
+            with self._lock:
+                self._cache[key] = verdict
+                if self.cache_path:
+                    self._persist(key, verdict)
+        return verdict
+
+    def _cached(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is None and self.cache_path:
+                self._load_persisted()
+                hit = self._cache.get(key)
+            return hit
+
+    # ------------------------------------------------------------------
+    # Cache su disco (chiamati con self._lock acquisito)
+    # ------------------------------------------------------------------
+
+    def _read_persisted(self) -> dict:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"[EncodingDetector] Cache {self.cache_path} illeggibile, ignorata: {e}")
+            return {}
+
+    def _load_persisted(self):
+        # Il file viene letto una volta per processo (poi basta la cache in memoria)
+        path = os.path.abspath(self.cache_path)
+        if path in self._loaded_paths:
+            return
+        self._loaded_paths.add(path)
+        for raw_key, (encoding, confidence) in self._read_persisted().items():
+            self._cache.setdefault(tuple(json.loads(raw_key)), (encoding, confidence))
+
+    def _persist(self, key: tuple, verdict: tuple):
+        # Rilettura prima della scrittura: non perde le voci aggiunte da altri processi
+        entries = self._read_persisted()
+        entries[json.dumps(list(key))] = list(verdict)
+        while len(entries) > self.MAX_PERSISTED:
+            entries.pop(next(iter(entries)))
+
+        try:
+            directory = os.path.dirname(self.cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            self.logger.warning(f"[EncodingDetector] Impossibile salvare la cache {self.cache_path}: {e}")
+
+    def _sample(self, filepath: str, size: int) -> bytes:
+        if size == 0:
+            return b""
+
+        # File piccolo: basta leggerlo tutto
+        if size <= self.sample_size * 3:
+            with open(filepath, "rb") as f:
+                return f.read()
+
+        with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            middle = (size - self.sample_size) // 2
+            head = mm[:self.sample_size]
+            mid = mm[middle:middle + self.sample_size]
+            tail = mm[size - self.sample_size:]
+
+        # Taglia ai bordi di riga per non spezzare caratteri multibyte a metà
+        return b"\n".join([
+            self._trim_to_lines(head, keep_start=True),
+            self._trim_to_lines(mid),
+            self._trim_to_lines(tail, keep_end=True),
+        ])
+
+    @staticmethod
+    def _trim_to_lines(chunk: bytes, keep_start: bool = False, keep_end: bool = False) -> bytes:
+        start = 0 if keep_start else chunk.find(b"\n") + 1
+        end = len(chunk) if keep_end else chunk.rfind(b"\n")
+        if end <= start:
+            return chunk
+        return chunk[start:end]
+
+
+def detect_file_encoding(filepath: str, sample_size: int = 64_000,
+                         cache_path: str = ".pyflowetl_encodings.json") -> tuple:
+    """
+    Scorciatoia: (encoding, confidence) del file usando la cache condivisa.
+    """
+    return EncodingDetector(sample_size=sample_size, cache_path=cache_path).detect(filepath)
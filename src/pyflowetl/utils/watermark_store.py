@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+from datetime import date, datetime
+
+import pandas as pd
+
+from pyflowetl.log import get_logger
+
+
+class WatermarkStore:
+    """
+    Piccolo state store locale (file JSON) per le estrazioni incrementali.
+
+    Per ogni job salva l'ultimo valore visto della colonna watermark
+    (timestamp di aggiornamento o id seriale). La scrittura è atomica
+    (file temporaneo + os.replace), quindi un crash non corrompe lo stato.
+
+    Esempio
+    -------
+    store = WatermarkStore("state/nightly.json")
+    last = store.get("crm.contatti")          # None al primo giro
+    store.set("crm.contatti", datetime(2025, 1, 31, 23, 59))
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, path: str = ".pyflowetl_state.json"):
+        self.path = path
+        self.logger = get_logger()
+
+    def get(self, job_name: str):
+        with self._lock:
+            entry = self._read().get(job_name)
+        return self._decode(entry) if entry is not None else None
+
+    def set(self, job_name: str, value):
+        with self._lock:
+            state = self._read()
+            state[job_name] = self._encode(value)
+            self._write(state)
+        self.logger.info(f"[WatermarkStore] {job_name} -> {value}")
+
+    def reset(self, job_name: str):
+        with self._lock:
+            state = self._read()
+            if state.pop(job_name, None) is not None:
+                self._write(state)
+
+    # ------------------------------------------------------------------
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write(self, state: dict):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _encode(value) -> dict:
+        if isinstance(value, datetime):
+            return {"type": "datetime", "value": value.isoformat()}
+        if isinstance(value, date):
+            return {"type": "date", "value": value.isoformat()}
+        if isinstance(value, bool):
+            raise TypeError("[WatermarkStore] Un watermark booleano non ha senso")
+        if isinstance(value, int):
+            return {"type": "int", "value": value}
+        if isinstance(value, float):
+            return {"type": "float", "value": value}
+        return {"type": "str", "value": str(value)}
+
+    @staticmethod
+    def _decode(entry: dict):
+        kind, value = entry["type"], entry["value"]
+        if kind == "datetime":
+            return datetime.fromisoformat(value)
+        if kind == "date":
+            return date.fromisoformat(value)
+        if kind == "int":
+            return int(value)
+        if kind == "float":
+            return float(value)
+        return value
+
+
+def max_watermark(df, column: str):
+    """
+    Massimo della colonna watermark nel DataFrame, convertito in tipo Python
+    (int/float/datetime/date/str). None se il DataFrame è vuoto o la colonna tutta nulla.
+    """
+    if df is None or df.empty or column not in df.columns:
+        return None
+    value = df[column].max()
+    if pd.isna(value):
+        return None
+    if hasattr(value, "to_pydatetime"):
+        return value.to_pydatetime()
+    if hasattr(value, "item"):
+        return value.item()
+    return value